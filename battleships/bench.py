@@ -0,0 +1,288 @@
+"""Load test: play bot-vs-bot games against a local server and report how it held up.
+
+    python -m battleships.bench --games 200 --concurrency 20 --workers 4 --json results.json
+    python -m battleships.bench --games 200 --concurrency 20 --workers 4 --baseline results.json
+    python -m battleships.bench --games 200 --concurrency 20 --loopback
+    python -m battleships.bench --games 200 --concurrency 20 --workers 4 --unix
+
+The server runs in its own process so its CPU and memory can be read off its /metrics;
+the bots run in a pool of worker processes, each playing several games at once over a shared
+connection pool, over TCP or (with --unix) a Unix socket. With --loopback, the server and the
+bots share one process and talk over remoter.loopback instead, which measures the framework
+without the network (the CPU and memory reported are then those of the whole process).
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from remoter import hooks, metrics
+import remoter.client
+import remoter.codec
+import remoter.loopback
+import remoter.server
+from battleships.bot import SmarterBot
+from battleships.game import Game
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(port, options, path=None):
+    sys.stdout = open(os.devnull, 'w')
+    logging.basicConfig(level=logging.WARNING)
+    srv = remoter.server.Server(**options)
+    srv.register(Game)
+    if path is not None:
+        srv.run(path=path)
+    else:
+        srv.run(host='127.0.0.1', port=port)
+
+
+async def scrape(port, session=None, path=None):
+    if session is not None:
+        async with session.request('GET', 'http://127.0.0.1:{}/metrics'.format(port)) as r:
+            return metrics.parse((await r.read()).decode())
+    connector = aiohttp.UnixConnector(path=path) if path is not None else None
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await scrape(port, session)
+
+
+async def wait_for_server(port, timeout=10, path=None):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return await scrape(port, path=path)
+        except aiohttp.ClientConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+async def play_game(host, transport, codec, timeout):
+    game = await host.new_game(Game)
+    await asyncio.wait_for(asyncio.gather(*(host.play(remoter.client.Client(Game, SmarterBot, transport=transport,
+                                                                            codec=codec), game)
+                                            for _ in range(2))), timeout)
+
+
+async def play_games(host, games, concurrency, transport, codec, timeout):
+    running = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with running:
+            await play_game(host, transport, codec, timeout)
+
+    results = await asyncio.gather(*(one() for _ in range(games)), return_exceptions=True)
+    return [r for r in results if isinstance(r, BaseException)]
+
+
+async def play_remote(port, path, games, concurrency, transport, codec, timeout):
+    async with remoter.client.Host('127.0.0.1', port, path=path) as host:
+        return await play_games(host, games, concurrency, transport, codec, timeout)
+
+
+async def play_loopback(options, games, concurrency, transport, codec, timeout):
+    """Returns the failures, the time taken, and the metrics from before and after"""
+    srv = remoter.server.Server(**options)
+    srv.register(Game)
+    async with remoter.loopback.Host(srv) as host:
+        before = await scrape(0, host.session)
+        started = time.perf_counter()
+        failures = await play_games(host, games, concurrency, transport, codec, timeout)
+        elapsed = time.perf_counter() - started
+        after = await scrape(0, host.session)
+    return failures, elapsed, before, after
+
+
+def timed(play, seed, *args):
+    """Run a play_ coroutine function with the bots seeded and quietened, noting the latency of every game call"""
+    random.seed(seed)
+    latencies = {}
+
+    def record(call):
+        if call.target == 'game' and call.outcome == 'ok':
+            latencies.setdefault(call.method, []).append(call.duration)
+    hook = hooks.add(after=record)
+    try:
+        # The bots narrate every move
+        with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+            return asyncio.run(play(*args)), latencies
+    finally:
+        hooks.remove(hook)
+
+
+def play(port, path, games, concurrency, transport, codec, timeout, seed):
+    """Play games in this (worker) process. Returns the failures and the latency of every game call"""
+    failures, latencies = timed(play_remote, seed, port, path, games, concurrency, transport, codec, timeout)
+    return [repr(f) for f in failures], latencies
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def total(samples, name, exclude_route=None):
+    return sum(v for (n, labels), v in samples.items()
+               if n == name and ('route', exclude_route) not in labels)
+
+
+def summarise(config, elapsed, failures, latencies, before, after):
+    games = config['games'] - len(failures)
+    requests = total(after, 'remoter_requests_total', '/metrics') - total(before, 'remoter_requests_total', '/metrics')
+    cpu = total(after, 'process_cpu_seconds_total') - total(before, 'process_cpu_seconds_total')
+    results = {
+        'config': config,
+        'elapsed': elapsed,
+        'games': games,
+        'failed': len(failures),
+        'games_per_sec': games / elapsed,
+        'requests': requests,
+        'requests_per_sec': requests / elapsed,
+        'requests_per_game': requests / games if games else None,
+        'server_cpu_seconds': cpu,
+        'server_cpu_per_game_ms': 1000 * cpu / games if games else None,
+        'server_max_rss_bytes': total(after, 'process_max_resident_memory_bytes') or None,
+        'latency_ms': {},
+    }
+    everything = [d for durations in latencies.values() for d in durations]
+    for method, durations in sorted(latencies.items()) + [('all', everything)]:
+        ordered = sorted(durations)
+        if ordered:
+            results['latency_ms'][method] = {
+                'count': len(ordered),
+                'p50': 1000 * percentile(ordered, 50),
+                'p90': 1000 * percentile(ordered, 90),
+                'p99': 1000 * percentile(ordered, 99),
+                'max': 1000 * ordered[-1],
+            }
+    return results
+
+
+def change(now, then):
+    if not then or now is None:
+        return ''
+    return ' ({:+.1f}%)'.format(100 * (now - then) / then)
+
+
+def report(results, baseline=None, out=sys.stdout):
+    base = baseline or {}
+
+    def line(label, key, fmt):
+        value = results[key]
+        text = 'n/a' if value is None else fmt.format(value)
+        print('{:<24} {}{}'.format(label, text, change(value, base.get(key))), file=out)
+
+    c = results['config']
+    print('{games} games, {concurrency} at a time in each of {workers} worker(s), over {transport}/{codec}'
+          .format(**c), file=out)
+    line('failed games', 'failed', '{}')
+    line('elapsed', 'elapsed', '{:.2f}s')
+    line('games/sec', 'games_per_sec', '{:.2f}')
+    line('requests', 'requests', '{:.0f}')
+    line('requests/sec', 'requests_per_sec', '{:.1f}')
+    line('requests/game', 'requests_per_game', '{:.1f}')
+    line('server cpu', 'server_cpu_seconds', '{:.2f}s')
+    line('server cpu/game', 'server_cpu_per_game_ms', '{:.2f}ms')
+    line('server peak rss', 'server_max_rss_bytes', '{:.0f}')
+
+    base_latency = base.get('latency_ms', {})
+    print('\n{:<24} {:>7} {:>8} {:>8} {:>8} {:>8}'.format('game call latency (ms)',
+                                                          'count', 'p50', 'p90', 'p99', 'max'), file=out)
+    for method, l in results['latency_ms'].items():
+        print('{:<24} {count:>7} {p50:>8.2f} {p90:>8.2f} {p99:>8.2f} {max:>8.2f}{}'.format(
+            method, change(l['p50'], base_latency.get(method, {}).get('p50')), **l), file=out)
+
+
+def run(games=100, concurrency=10, workers=2, transport='http', codec='json', timeout=60, seed=0, server=None,
+        loopback=False, unix=False):
+    """Play the games against a fresh local server; returns the results as a dict"""
+    if loopback:
+        config = dict(games=games, concurrency=concurrency, workers=1, transport=transport + ' loopback',
+                      codec=codec, seed=seed)
+        (failures, elapsed, before, after), latencies = timed(play_loopback, seed, server or {}, games, concurrency,
+                                                              transport, codec, timeout)
+        return summarise(config, elapsed, [repr(f) for f in failures], latencies, before, after)
+
+    config = dict(games=games, concurrency=concurrency, workers=workers,
+                  transport=transport + (' unix' if unix else ''), codec=codec, seed=seed)
+    port = free_port()
+    sockets = tempfile.mkdtemp(prefix='batbench-') if unix else None
+    path = os.path.join(sockets, 'server.sock') if unix else None
+    srv = multiprocessing.Process(target=serve, args=(port, server or {}, path), daemon=True)
+    srv.start()
+    try:
+        before = asyncio.run(wait_for_server(port, path=path))
+
+        # Share the games out between the workers
+        shares = [games // workers + (n < games % workers) for n in range(workers)]
+        started = time.perf_counter()
+        with multiprocessing.Pool(workers) as pool:
+            played = pool.starmap(play, [(port, path, share, concurrency, transport, codec, timeout, seed + n)
+                                         for n, share in enumerate(shares) if share])
+        elapsed = time.perf_counter() - started
+
+        after = asyncio.run(scrape(port, path=path))
+    finally:
+        srv.terminate()
+        srv.join()
+        if sockets is not None:
+            shutil.rmtree(sockets, ignore_errors=True)
+
+    failures = [f for fs, _ in played for f in fs]
+    latencies = {}
+    for _, ls in played:
+        for method, durations in ls.items():
+            latencies.setdefault(method, []).extend(durations)
+    return summarise(config, elapsed, failures, latencies, before, after)
+
+
+def main():
+    p = argparse.ArgumentParser('batbench')
+    p.add_argument('--games', type=int, default=100, help='how many games to play in all')
+    p.add_argument('--concurrency', type=int, default=10, help='games each worker plays at once')
+    p.add_argument('--workers', type=int, default=2, help='client processes')
+    p.add_argument('--transport', choices=remoter.client.Client.TRANSPORTS, default='http')
+    p.add_argument('--codec', choices=sorted(remoter.codec.CODECS), default='json')
+    p.add_argument('--timeout', type=float, default=60, help='give up on a game after this long')
+    p.add_argument('--seed', type=int, default=0, help='seeds the bots, so runs place the same ships')
+    p.add_argument('--loopback', action='store_true',
+                   help='play in this one process over remoter.loopback, without the network (not with ws)')
+    p.add_argument('--unix', action='store_true', help='reach the server over a Unix socket instead of TCP')
+    p.add_argument('--json', help='also write the results to this file')
+    p.add_argument('--baseline', help='compare against results written earlier with --json')
+    args = p.parse_args()
+
+    if args.loopback and args.transport == 'ws':
+        p.error('--loopback works with the http and sync transports')
+    results = run(games=args.games, concurrency=args.concurrency, workers=args.workers,
+                  transport=args.transport, codec=args.codec, timeout=args.timeout, seed=args.seed,
+                  loopback=args.loopback, unix=args.unix)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -26,7 +26,63 @@ def parse_bomb_location(loc):
     return col, row
 
 
-class Board:
+class Geometry:
+    """Bit masks for a board of a given size, shared by every board of that size.
+
+    Cell (x, y) is bit y * width + x.
+    """
+    def __init__(self, width, height):
+        self.mx = width
+        self.my = height
+        self.bit = {(x, y): 1 << (y * width + x) for y in range(height) for x in range(width)}
+        # Each cell and those touching it
+        self.around = {(x, y): sum(self.bit.get((x + dx, y + dy), 0)
+                                   for dx in (-1, 0, 1)
+                                   for dy in (-1, 0, 1))
+                       for (x, y) in self.bit}
+        # The cells touching each one at a corner
+        self.corners = {(x, y): sum(self.bit.get((x + dx, y + dy), 0) for dx in (-1, 1) for dy in (-1, 1))
+                        for (x, y) in self.bit}
+        # (x, y, dx, dy, size) -> (cells, ship mask, mask of the ship and its surroundings)
+        self.placements = {}
+
+    def placement(self, x, y, dx, dy, size):
+        """The cells and masks for a ship, or None if it doesn't lie on the board"""
+        key = x, y, dx, dy, size
+        try:
+            return self.placements[key]
+        except KeyError:
+            pass
+        cells = [(x + i * dx, y + i * dy) for i in range(size)]
+        if any(c not in self.bit for c in cells):
+            return None
+        ship = around = 0
+        for c in cells:
+            ship |= self.bit[c]
+            around |= self.around[c]
+        placement = cells, ship, around
+        # Only straight ships, so the cache stays small
+        if dx in (-1, 0, 1) and dy in (-1, 0, 1):
+            self.placements[key] = placement
+        return placement
+
+
+_geometries = {}
+
+
+def geometry(width, height):
+    try:
+        return _geometries[width, height]
+    except KeyError:
+        g = _geometries[width, height] = Geometry(width, height)
+        return g
+
+
+class BoardView:
+    """What can be seen of a board: a dict of what's in each cell, drawn as text.
+
+    A player keeps one for each board, brought up to date with the changes the Game sends it.
+    """
     # potshots return one of these
     MISS = 0
     NEAR = 1
@@ -37,80 +93,161 @@ class Board:
     GUESS = "."
     NEAR_GUESS = "!"
     SUNK = "X"
+    SEA = "~"
 
     def __init__(self, width=10, height=10):
-        assert 0 < width <= 10
-        assert 0 < height <= 10
-
         self.mx = width
         self.my = height
 
-        # Coordinate pair -> ship, miss, near-miss.
+        # Coordinate pair -> ship, miss, near-miss or sunk
         self.sea = {}
+        # The drawn rows of the board, or None where they've changed since
+        self.rows = [None] * height
+        # How many changes have been made to the board
+        self.version = 0
+
+    def update(self, changes):
+        """Apply the changes from Board.changes().
+
+        Return False, changing nothing, if they don't follow on from our version.
+        """
+        if changes['since'] > self.version or changes['version'] < self.version:
+            return False
+        if changes['since'] == 0:
+            self.sea.clear()
+            self.rows = [None] * self.my
+        for x, y, cell in changes['cells']:
+            if cell == BoardView.SEA:
+                self.sea.pop((x, y), None)
+            else:
+                self.sea[x, y] = cell
+            self.rows[y] = None
+        self.version = changes['version']
+        return True
+
+    def display(self):
+        print('\n'.join(self.lines()))
+
+    def lines(self):
+        rows = self.rows
+        for y, row in enumerate(rows):
+            if row is None:
+                rows[y] = ascii_lowercase[y] + ' ' + ''.join(self.sea.get((x, y), BoardView.SEA)
+                                                             for x in range(self.mx))
+        return ["  " + digits[:self.mx]] + rows
+
+    def other_lines(self):
+        return [line.replace(BoardView.SHIP, BoardView.SEA) for line in self.lines()]
+
+
+class Board(BoardView):
+    """A board held as bit masks - where the ships are, which of their cells are hit, and the misses
+    and near misses - so shots, placements and defeat are checked with a few integer operations.
+
+    Each change is also logged, so a player can be sent just the cells that changed since it last looked.
+    """
+    def __init__(self, width=10, height=10):
+        assert 0 < width <= 10
+        assert 0 < height <= 10
+
+        super().__init__(width, height)
+        self.geometry = geometry(width, height)
+
+        self.ships = 0
+        self.hits = 0
+        self.misses = 0
+        self.near = 0
+        # (x, y, cell) for every change, in order; sea, kept in step with the masks, is for drawing
+        # the board and for anyone reading it. Don't write to either: use set().
+        self.log = []
+
+    def __getstate__(self):
+        return {'mx': self.mx, 'my': self.my, 'log': self.log}
+
+    def __setstate__(self, state):
+        self.__init__(state['mx'], state['my'])
+        if 'log' in state:
+            for x, y, cell in state['log']:
+                self.set(x, y, cell)
+        else:
+            # Pickled before boards were bit masks
+            for (x, y), cell in state['sea'].items():
+                self.set(x, y, cell)
+
+    def changes(self, since=0, hide_ships=False):
+        """The cells changed after version `since`, for BoardView.update(). Everything, if since is 0.
+
+        With hide_ships, leave out the cells of ships that haven't been hit.
+        """
+        if since > len(self.log):
+            # We've gone back in time (restored from an older snapshot): start again
+            since = 0
+        cells = {}
+        for x, y, cell in self.log[since:]:
+            cells[x, y] = cell
+        return {'since': since, 'version': len(self.log),
+                'cells': [[x, y, cell] for (x, y), cell in cells.items()
+                          if not (hide_ships and cell == Board.SHIP)]}
+
+    def set(self, x, y, cell):
+        bit = self.geometry.bit[x, y]
+        self.ships &= ~bit
+        self.hits &= ~bit
+        self.misses &= ~bit
+        self.near &= ~bit
+        if cell == Board.SHIP:
+            self.ships |= bit
+        elif cell == Board.SUNK:
+            self.ships |= bit
+            self.hits |= bit
+        elif cell == Board.GUESS:
+            self.misses |= bit
+        elif cell == Board.NEAR_GUESS:
+            self.near |= bit
+        self.sea[x, y] = cell
+        self.rows[y] = None
+        self.log.append((x, y, cell))
+        self.version = len(self.log)
 
     def add_ship(self, x, y, dx, dy, size):
         """Add a ship fo a given length
 
         If it passes off the board, or abuts an already places ship, raise a ValueError
         """
-        cells = {(x + i * dx, y + i * dy) for i in range(size)}
-        if any(cx < 0 or cx >= self.mx or cy < 0 or cy >= self.my
-               for (cx, cy) in cells):
+        placement = self.geometry.placement(x, y, dx, dy, size)
+        if placement is None:
             raise ValueError("That ship does not lie on the board")
 
-        neighbours = {(cx + dx, cy + dy)
-                      for dx in (-1, 0, 1)
-                      for dy in (-1, 0, 1)
-                      for (cx, cy) in cells}
-
-        if any((nx, ny) in self.sea
-               for (nx, ny) in neighbours):
+        cells, ship, around = placement
+        if around & (self.ships | self.misses | self.near):
             raise ValueError("That ship abuts another")
 
+        self.ships |= ship
         for (cx, cy) in cells:
-            self.add_counter(cx, cy)
+            self.sea[cx, cy] = Board.SHIP
+            self.rows[cy] = None
+            self.log.append((cx, cy, Board.SHIP))
+        self.version = len(self.log)
 
     def add_counter(self, x, y):
-        self.sea[x, y] = Board.SHIP
+        self.set(x, y, Board.SHIP)
 
     def potshot(self, x, y):
         """Return MISS, NEAR or HIT"""
         if x < 0 or self.mx <= x or y < 0 or self.my <= y:
             raise ValueError("Off-grid shot")
 
-        if self.sea.get((x, y)) == Board.SHIP:
-            self.sea[x, y] = Board.SUNK
+        bit = self.geometry.bit[x, y]
+        if bit & self.ships & ~self.hits:
+            self.set(x, y, Board.SUNK)
             return Board.HIT
-        elif any(self.sea.get((x + dx, y + dy)) in (Board.SHIP, Board.SUNK)
-                 for dx in (-1, 0, 1)
-                 for dy in (-1, 0, 1)):
-            self.sea[x, y] = Board.NEAR_GUESS
+        elif self.geometry.around[x, y] & self.ships:
+            # (Which, for a cell already sunk, replaces it with a near miss)
+            self.set(x, y, Board.NEAR_GUESS)
             return Board.NEAR
         else:
-            self.sea[x, y] = Board.GUESS
+            self.set(x, y, Board.GUESS)
             return Board.MISS
 
     def defeated(self):
-        return not any(cell == Board.SHIP
-                       for _, cell in self.sea.items())
-
-    def display(self):
-        print('\n'.join(self.lines()))
-
-    def lines(self):
-        d = ["  " + digits[:self.mx]]
-        for y in range(self.my):
-            line = ""
-            for x in range(self.mx):
-                line += self.sea.get((x, y), '~')
-            d.append(ascii_lowercase[y] + ' ' + line)
-        return d
-
-    def other_lines(self):
-        d = ["  " + digits[:self.mx]]
-        for y in range(self.my):
-            line = ""
-            for x in range(self.mx):
-                line += self.sea.get((x, y), '~').replace(Board.SHIP, '~')
-            d.append(ascii_lowercase[y] + ' ' + line)
-        return d
+        return not self.ships & ~self.hits
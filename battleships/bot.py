@@ -1,11 +1,16 @@
 from collections import namedtuple
 import random
-from remoter import BasePlayer
-from battleships.board import Board, ships
-from battleships.game import Game
+from battleships.board import Board, geometry, ships
+from battleships.game import BoardsPlayer, Game
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-Placement = namedtuple('Placement', ['x', 'y', 'dx', 'dy', 'cells', 'size'])
+
+# mask: the ship's cells as a bit mask (see battleships.board.Geometry); around: it and its surroundings
+Placement = namedtuple('Placement', ['x', 'y', 'dx', 'dy', 'cells', 'size', 'mask', 'around'])
 Coord = namedtuple('Coord', ['x', 'y'])
 
 
@@ -13,78 +18,79 @@ def cells(x, y, dx, dy, size):
     return frozenset(Coord(x + i * dx, y + i * dy) for i in range(size))
 
 
+_placements = {}
+
+
+def placement_table(width, height, size):
+    """Every way to put a ship of a size on an empty board, worked out once per board size"""
+    try:
+        return _placements[width, height, size]
+    except KeyError:
+        pass
+    g = geometry(width, height)
+    table = []
+    for dx, dy in (1, 0), (0, 1):
+        for x in range(width - dx * (size - 1)):
+            for y in range(height - dy * (size - 1)):
+                _, mask, around = g.placement(x, y, dx, dy, size)
+                table.append(Placement(x, y, dx, dy, cells(x, y, dx, dy, size), size, mask, around))
+    _placements[width, height, size] = table
+    return table
+
+
 def possible_placements(board, size):
     """Return a set of Placements"""
-    return {Placement(x, y, 1, 0, cells(x, y, 1, 0, size), size)
-            for x in range(board.mx - size + 1)
-            for y in range(board.my)}.union(
-           {Placement(x, y, 0, 1, cells(x, y, 0, 1, size), size)
-            for x in range(board.mx)
-            for y in range(board.my - size + 1)})
-
-
-def parse_other(lines):
-    """Parse a series of lines in the format:
-      0123456789
-    a ~~~~~~~~~~
-    ...
-    j ~~~~~~~~~~
-
-    Return a map of [x, y] -> MISS, NEAR_MISS or SUNK"""
-    parse = {}
-    for y, line in enumerate(lines[1:]):
-        for x, c in enumerate(line[2:]):
-            if c == Board.GUESS:
-                parse[x, y] = Board.GUESS
-            elif c == Board.NEAR_GUESS:
-                parse[x, y] = Board.NEAR_GUESS
-            elif c == Board.SUNK:
-                parse[x, y] = Board.SUNK
-    return parse
-
-
-class Bot(BasePlayer):
+    return set(placement_table(board.mx, board.my, size))
+
+
+class Bot(BoardsPlayer):
     async def get_ships(self, pn):
         self.pn = pn
         print("Player {} pick your ships!".format(pn))
         print("Use: R C D for input (R: row; C: column; D = A for across, D for down)")
 
         b = Board()
-        for ship, size in ships:
-            possibles = [p
-                         for p in possible_placements(b, size)
-                         if all({(c.x + dx, c.y + dy) not in b.sea
-                                 for dx in (-1, 0, 1)
-                                 for dy in (-1, 0, 1)
-                                 for c in p.cells})]
+        # Place every ship, and fetch the board after each, in one round trip
+        added = []
+        async with self.batch() as batch:
+            for ship, size in ships:
+                # Anywhere that doesn't touch the ships placed so far
+                possibles = [p for p in placement_table(b.mx, b.my, size) if not p.around & b.ships]
 
-            place = random.choice(possibles)
-            b.add_ship(place.x, place.y, place.dx, place.dy, place.size)
+                place = random.choice(possibles)
+                b.add_ship(place.x, place.y, place.dx, place.dy, place.size)
+                added.append((ship, place, batch.add_ship(pn, place.x, place.y, place.dx, place.dy, place.size),
+                              batch.my_board(pn)))
 
+        for ship, place, placed, board in added:
             print('Adding {} at ({}, {}) - ({}, {})'.format(ship,
                                                             place.x, place.y,
                                                             place.x + place.dx * (place.size - 1), place.y + place.dy * (place.size - 1)))
-            assert await self.game.add_ship(pn, place.x, place.y, place.dx, place.dy, place.size)
+            assert placed.result()
             print()
-            await self.display()
+            print('\n'.join(board.result()))
 
         print()
         print("Your final board:")
-        await self.display()
-
-    async def display(self):
-        # This must be a coroutine since it uses `await` - making a call back to the Game server
-        print('\n'.join(await self.game.my_board(self.pn)))
+        print('\n'.join(board.result()))
 
-    async def guess(self, my_lines, other_lines):
+    def show_boards(self):
         print()
         print("Player {}, it's your go!".format(self.pn))
         print()
         print("Your board", "Their board", sep='\t')
-        for me, them in zip(my_lines, other_lines):
+        for me, them in zip(self.mine.lines(), self.theirs.lines()):
             print(me, them, sep='\t')
 
-        state = parse_other(other_lines)
+    async def display(self):
+        # This must be a coroutine since it uses `await` - making a call back to the Game server
+        print('\n'.join(await self.game.my_board(self.pn)))
+
+    async def guess(self, pn, mine, theirs):
+        await self.update_boards(pn, mine, theirs)
+        self.show_boards()
+
+        state = dict(self.theirs.sea)
 
         coords = [(x, y)
                   for y in range(10)
@@ -95,15 +101,11 @@ class Bot(BasePlayer):
 
 
 class SmarterBot(Bot):
-    async def guess(self, my_lines, other_lines):
-        print()
-        print("Player {}, it's your go!".format(self.pn))
-        print()
-        print("Your board", "Their board", sep='\t')
-        for me, them in zip(my_lines, other_lines):
-            print(me, them, sep='\t')
+    async def guess(self, pn, mine, theirs):
+        await self.update_boards(pn, mine, theirs)
+        self.show_boards()
 
-        state = parse_other(other_lines)
+        state = dict(self.theirs.sea)
 
         for x, y in list(state):
             if state[x, y] == Board.SUNK:
@@ -125,6 +127,164 @@ class SmarterBot(Bot):
         return random.choice(coords)
 
 
+class DensityBot(Bot):
+    """Shoots wherever the most ways of placing the ships would put a ship.
+
+    What's known of their board is kept as bit masks, brought up to date from the changes sent
+    with each guess. Placements over cells known to be empty, or touching a hit without covering
+    it, are ruled out; those covering hits, or near misses not yet accounted for by a hit, count
+    for more - so once something is hit, the bot finishes it off.
+    """
+    # How many times more a placement counts for each hit it covers, and each unexplained near miss
+    HIT_WEIGHT = 50
+    NEAR_WEIGHT = 5
+
+    # The version of their board that the masks are up to date with
+    known = None
+
+    def learn(self, theirs):
+        view = self.theirs
+        g = geometry(view.mx, view.my)
+        if theirs['since'] == self.known and theirs['version'] == view.version:
+            changed = theirs['cells']
+        else:
+            # First time, or the changes weren't enough and we fetched the whole board
+            self.shot = self.hits = self.empty = self.near = 0
+            changed = [(x, y, cell) for (x, y), cell in view.sea.items()]
+
+        for x, y, cell in changed:
+            bit = g.bit[x, y]
+            self.shot |= bit
+            if cell == Board.SUNK:
+                # Ships are straight, and don't touch
+                self.hits |= bit
+                self.empty |= g.corners[x, y]
+            elif cell == Board.GUESS:
+                self.empty |= g.around[x, y]
+            elif cell == Board.NEAR_GUESS:
+                self.empty |= bit
+                self.near |= bit
+        self.known = view.version
+
+    def density(self):
+        """How many (weighted) ways of placing the fleet cover each cell, by bit position"""
+        view = self.theirs
+        g = geometry(view.mx, view.my)
+        # The surroundings of near misses that no hit accounts for yet: each has a ship in it somewhere
+        nears = []
+        near = self.near
+        while near:
+            bit = near & -near
+            near ^= bit
+            i = bit.bit_length() - 1
+            around = g.around[i % view.mx, i // view.mx]
+            if not around & self.hits:
+                nears.append(around)
+        fleet = [size for _, size in ships]
+        if numpy is not None:
+            return density_numpy(view.mx, view.my, fleet, self.empty, self.hits, nears,
+                                 self.HIT_WEIGHT, self.NEAR_WEIGHT)
+
+        counts = [0] * (view.mx * view.my)
+        for size in set(fleet):
+            for p, indices in placement_indices(view.mx, view.my, size):
+                if p.mask & self.empty or p.around & self.hits & ~p.mask:
+                    continue
+                w = fleet.count(size)
+                covered = p.mask & self.hits
+                if covered:
+                    w *= self.HIT_WEIGHT ** bin(covered).count('1')
+                for n in nears:
+                    if p.mask & n:
+                        w *= self.NEAR_WEIGHT
+                for i in indices:
+                    counts[i] += w
+        return counts
+
+    def target(self):
+        view = self.theirs
+        counts = self.density()
+        ruled_out = self.shot | self.empty
+        best, cells = 0, []
+        for i, n in enumerate(counts):
+            if ruled_out >> i & 1 or n < best:
+                continue
+            if n > best:
+                best, cells = n, []
+            cells.append(i)
+        if not cells:
+            # Nothing adds up (someone's cheating?): anywhere we haven't tried
+            cells = [i for i in range(view.mx * view.my) if not self.shot >> i & 1]
+        i = random.choice(cells)
+        return i % view.mx, i // view.mx
+
+    async def guess(self, pn, mine, theirs):
+        await self.update_boards(pn, mine, theirs)
+        self.show_boards()
+        self.learn(theirs)
+        return self.target()
+
+
+_indices = {}
+
+
+def placement_indices(width, height, size):
+    """The placements of a ship, each with the bit positions of its cells"""
+    try:
+        return _indices[width, height, size]
+    except KeyError:
+        table = _indices[width, height, size] = [(p, [c.y * width + c.x for c in p.cells])
+                                                 for p in placement_table(width, height, size)]
+        return table
+
+
+_tables = {}
+
+
+def placement_arrays(width, height, fleet):
+    """For NumPy: the placements of each ship in the fleet as arrays of (two-word) masks of their cells
+    and of their surroundings, and of the bit positions of their cells"""
+    key = width, height, tuple(fleet)
+    try:
+        return _tables[key]
+    except KeyError:
+        pass
+    rows = [p for size in fleet for p in placement_table(width, height, size)]
+    # Pad the positions of shorter ships with one past the end of the board
+    n = width * height
+    longest = max(fleet)
+    positions = numpy.array([[i for i in range(n) if p.mask >> i & 1] + [n] * (longest - p.size) for p in rows])
+    arrays = _tables[key] = words([p.mask for p in rows]), words([p.around & ~p.mask for p in rows]), positions
+    return arrays
+
+
+def words(masks):
+    """Masks of up to 128 bits as a pair of arrays of their low and high 64 bits"""
+    return (numpy.array([m & 0xffffffffffffffff for m in masks], dtype=numpy.uint64),
+            numpy.array([m >> 64 for m in masks], dtype=numpy.uint64))
+
+
+def overlaps(a, mask):
+    lo, hi = words([mask])
+    return ((a[0] & lo) | (a[1] & hi)) != 0
+
+
+def density_numpy(width, height, fleet, empty, hits, nears, hit_weight, near_weight):
+    cells, surroundings, positions = placement_arrays(width, height, fleet)
+    n = width * height
+    hit = numpy.zeros(n + 1, dtype=numpy.int64)
+    hit[[i for i in range(n) if hits >> i & 1]] = 1
+    covered = hit[positions].sum(axis=1)
+    # Nothing known to be empty, and no hits around that aren't covered
+    valid = ~overlaps(cells, empty) & ~overlaps(surroundings, hits)
+    w = valid * numpy.power(float(hit_weight), covered)
+    for m in nears:
+        w *= numpy.where(overlaps(cells, m), float(near_weight), 1.0)
+    # Weights are whole numbers well inside floating point's exact range
+    counts = numpy.bincount(positions.ravel(), weights=numpy.repeat(w, positions.shape[1]), minlength=n + 1)
+    return counts[:n].astype(numpy.int64).tolist()
+
+
 if __name__ == '__main__':
     import asyncio
     g = Game()
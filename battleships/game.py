@@ -1,12 +1,21 @@
 import asyncio
-from remoter import BasePlayer
-from battleships.board import Board, parse_ship_location, parse_bomb_location, ships
+from remoter import BasePlayer, DeadlineExceeded
+from battleships.board import Board, BoardView, parse_ship_location, parse_bomb_location, ships
 
 
 class Game:
+    # A player who takes longer than this over placing their ships or a guess forfeits the game
+    deadline = 600
+    on_deadline = 'forfeit'
+
     def __init__(self):
         self.players = []
         self.boards = {}
+        # Index into self.players of whoever shoots next, and the winner's number once there is one
+        self.turn = 0
+        self.winner = None
+        # Player number -> the versions of their own board and their opponent's that they've been sent
+        self.seen = {}
 
     async def new_player(self, plr):
         if len(self.players) < 2:
@@ -22,20 +31,43 @@ class Game:
             # to determine if everyone is good to go.
             plr.ready = False
 
-            # Tell the player who they are, and ask them for their ship placements.
-            await plr.get_ships(pn)
-
-            # Once they're ready, check if everyone else is too.
-            plr.ready = True
-
-            # Is everyone ready?
-            if len(self.players) > 1 and all(p.ready for p in self.players):
-                # Could just use "await self.game_loop()" here.
-                asyncio.create_task(self.game_loop())
+            await self.setup(plr)
         else:
             await plr.print("Too many players already connected to this game.")
             await plr.exit(0)
 
+    async def setup(self, plr):
+        # Tell the player who they are, and ask them for their ship placements.
+        try:
+            await plr.get_ships(plr.pn)
+        except DeadlineExceeded:
+            await self.forfeit(plr)
+            return
+
+        # Once they're ready, check if everyone else is too.
+        plr.ready = True
+
+        # Is everyone ready?
+        if len(self.players) > 1 and all(p.ready for p in self.players):
+            # Could just use "await self.game_loop()" here.
+            asyncio.create_task(self.game_loop())
+
+    async def resume(self):
+        """Called when the game is restored from a snapshot after a server restart.
+
+        Pick up the setup of any player who hadn't finished placing their ships (starting
+        their board afresh), or else carry on the game from whoever's turn it was.
+        """
+        if self.winner is not None:
+            return
+        unready = [p for p in self.players if not p.ready]
+        for plr in unready:
+            self.boards[plr.pn] = Board()
+        if unready:
+            await asyncio.gather(*(self.setup(p) for p in unready))
+        elif len(self.players) > 1:
+            await self.game_loop()
+
     async def my_board(self, pn):
         """This is called by the Player to return the image of their board.
 
@@ -44,6 +76,16 @@ class Game:
         board = self.boards[pn]
         return board.lines()
 
+    async def board(self, pn, theirs=False):
+        """This is called by the Player to fetch the whole of their board or (without its ships)
+        their opponent's, as Board.changes.
+
+        Used when they've lost track of the changes sent with guess.
+        """
+        if theirs:
+            return self.boards[3 - pn].changes(hide_ships=True)
+        return self.boards[pn].changes()
+
     async def add_ship(self, pn, x, y, dx, dy, size):
         """This is called by the Player to place a ship.
 
@@ -59,13 +101,28 @@ class Game:
     async def game_loop(self):
         """Drive a game between two players.
         """
-        other, player = self.players
-        while not self.boards[other.pn].defeated():
-            player, other = other, player
+        while True:
+            player, other = self.players[self.turn], self.players[1 - self.turn]
 
-            x, y = await player.guess(self.boards[player.pn].lines(), self.boards[other.pn].other_lines())
+            # Send only what's changed since the player last looked
+            mine, theirs = self.boards[player.pn], self.boards[other.pn]
+            seen_mine, seen_theirs = self.seen.get(player.pn, (0, 0))
+            versions = mine.version, theirs.version
+            try:
+                x, y = await player.guess(player.pn, mine.changes(seen_mine),
+                                          theirs.changes(seen_theirs, hide_ships=True))
+            except DeadlineExceeded:
+                await self.forfeit(player)
+                return
+            self.seen[player.pn] = versions
 
             result = self.boards[other.pn].potshot(x, y)
+            # Record the outcome before telling anyone, in case we're snapshotted meanwhile
+            if self.boards[other.pn].defeated():
+                self.winner = player.pn
+            else:
+                self.turn = 1 - self.turn
+
             if result == Board.MISS:
                 await player.print("Splash!")
             elif result == Board.NEAR:
@@ -73,14 +130,46 @@ class Game:
             else:
                 await player.print("BOOM!!!")
 
+            if self.winner is not None:
+                break
 
         await player.print("The winner is {}".format(player.pn))
         await other.print("The winner is {}".format(player.pn))
         await player.exit(0)
         await other.exit(0)
 
+    async def forfeit(self, plr):
+        """A player ran out of time, and has been dropped: whoever else is playing wins"""
+        others = [p for p in self.players if p is not plr]
+        if not others or self.winner is not None:
+            return
+        other = others[0]
+        self.winner = other.pn
+        await other.print("Player {} ran out of time. The winner is {}".format(plr.pn, other.pn))
+        await other.exit(0)
+
+
+class BoardsPlayer(BasePlayer):
+    """A player that keeps copies of its board and its opponent's, up to date with the changes sent
+    with each guess"""
+    # Set by get_ships; a client reconnecting mid-game won't know it until its first guess
+    pn = None
+    mine = None
+    theirs = None
+
+    async def update_boards(self, pn, mine, theirs):
+        self.pn = pn
+        if self.mine is None:
+            self.mine, self.theirs = BoardView(), BoardView()
+        # If we've missed some changes (say we've just reconnected), fetch the lot
+        if not self.mine.update(mine):
+            self.mine.update(await self.game.board(pn))
+        if not self.theirs.update(theirs):
+            self.theirs.update(await self.game.board(pn, True))
+
+
+class Player(BoardsPlayer):
 
-class Player(BasePlayer):
     async def get_ships(self, pn):
         self.pn = pn
         print("Player {} pick your ships!".format(pn))
@@ -112,12 +201,13 @@ class Player(BasePlayer):
         # This must be a coroutine since it uses `await` - making a call back to the Game server
         print('\n'.join(await self.game.my_board(self.pn)))
 
-    async def guess(self, my_lines, other_lines):
+    async def guess(self, pn, mine, theirs):
+        await self.update_boards(pn, mine, theirs)
         print()
         print("Player {}, it's your go!".format(self.pn))
         print()
         print("Your board", "Their board", sep='\t')
-        for me, them in zip(my_lines, other_lines):
+        for me, them in zip(self.mine.lines(), self.theirs.lines()):
             print(me, them, sep='\t')
 
         while True:
@@ -0,0 +1,33 @@
+from battleships.bench import percentile, run, summarise
+
+
+def test_summarise():
+    config = dict(games=4, concurrency=2, workers=1, transport='http', codec='json', seed=0)
+    before = {('remoter_requests_total', (('method', 'GET'), ('route', '/metrics'), ('status', '200'))): 1,
+              ('process_cpu_seconds_total', ()): 1.0}
+    after = {('remoter_requests_total', (('method', 'GET'), ('route', '/metrics'), ('status', '200'))): 2,
+             ('remoter_requests_total', (('method', 'POST'), ('route', '/{cls}'), ('status', '200'))): 300,
+             ('process_cpu_seconds_total', ()): 3.0}
+    latencies = {'add_ship': [0.001 * n for n in range(1, 101)], 'my_board': [0.5]}
+
+    r = summarise(config, 2.0, ['TimeoutError()'], latencies, before, after)
+    assert (r['games'], r['failed']) == (3, 1)
+    assert r['games_per_sec'] == 1.5
+    assert r['requests'] == 300
+    assert r['requests_per_game'] == 100
+    assert r['server_cpu_seconds'] == 2.0
+    assert r['server_max_rss_bytes'] is None
+    assert round(r['latency_ms']['add_ship']['p50']) == 51
+    assert r['latency_ms']['all']['count'] == 101
+    assert r['latency_ms']['all']['max'] == 500
+
+
+def test_percentile():
+    assert percentile([1, 2, 3, 4], 50) == 3
+    assert percentile([1, 2, 3, 4], 100) == 4
+
+
+def test_loopback_run():
+    r = run(games=2, concurrency=2, transport='sync', loopback=True)
+    assert (r['games'], r['failed']) == (2, 0)
+    assert r['requests'] > 0
@@ -1,5 +1,9 @@
 import pytest
-from battleships.board import Board
+import pickle
+import random
+from string import ascii_lowercase, digits
+
+from battleships.board import Board, BoardView
 
 
 def test_board():
@@ -61,3 +65,157 @@ def test_ship_must_not_be_adjacent_to_another():
         for dy in -1, 0, 1:
             with pytest.raises(ValueError):
                 b.add_ship(5 + dx, 5 + dy, 0, 0, 1)
+
+
+class DictBoard:
+    """The original board, a dict of coordinates: the reference Board is checked against"""
+    # potshots return one of these
+    MISS = 0
+    NEAR = 1
+    HIT = 2
+
+    # the board representation uses one of these
+    SHIP = "S"
+    GUESS = "."
+    NEAR_GUESS = "!"
+    SUNK = "X"
+
+    def __init__(self, width=10, height=10):
+        assert 0 < width <= 10
+        assert 0 < height <= 10
+
+        self.mx = width
+        self.my = height
+
+        # Coordinate pair -> ship, miss, near-miss.
+        self.sea = {}
+
+    def add_ship(self, x, y, dx, dy, size):
+        """Add a ship fo a given length
+
+        If it passes off the board, or abuts an already places ship, raise a ValueError
+        """
+        cells = {(x + i * dx, y + i * dy) for i in range(size)}
+        if any(cx < 0 or cx >= self.mx or cy < 0 or cy >= self.my
+               for (cx, cy) in cells):
+            raise ValueError("That ship does not lie on the board")
+
+        neighbours = {(cx + dx, cy + dy)
+                      for dx in (-1, 0, 1)
+                      for dy in (-1, 0, 1)
+                      for (cx, cy) in cells}
+
+        if any((nx, ny) in self.sea
+               for (nx, ny) in neighbours):
+            raise ValueError("That ship abuts another")
+
+        for (cx, cy) in cells:
+            self.add_counter(cx, cy)
+
+    def add_counter(self, x, y):
+        self.sea[x, y] = Board.SHIP
+
+    def potshot(self, x, y):
+        """Return MISS, NEAR or HIT"""
+        if x < 0 or self.mx <= x or y < 0 or self.my <= y:
+            raise ValueError("Off-grid shot")
+
+        if self.sea.get((x, y)) == Board.SHIP:
+            self.sea[x, y] = Board.SUNK
+            return Board.HIT
+        elif any(self.sea.get((x + dx, y + dy)) in (Board.SHIP, Board.SUNK)
+                 for dx in (-1, 0, 1)
+                 for dy in (-1, 0, 1)):
+            self.sea[x, y] = Board.NEAR_GUESS
+            return Board.NEAR
+        else:
+            self.sea[x, y] = Board.GUESS
+            return Board.MISS
+
+    def defeated(self):
+        return not any(cell == Board.SHIP
+                       for _, cell in self.sea.items())
+
+    def display(self):
+        print('\n'.join(self.lines()))
+
+    def lines(self):
+        d = ["  " + digits[:self.mx]]
+        for y in range(self.my):
+            line = ""
+            for x in range(self.mx):
+                line += self.sea.get((x, y), '~')
+            d.append(ascii_lowercase[y] + ' ' + line)
+        return d
+
+    def other_lines(self):
+        d = ["  " + digits[:self.mx]]
+        for y in range(self.my):
+            line = ""
+            for x in range(self.mx):
+                line += self.sea.get((x, y), '~').replace(Board.SHIP, '~')
+            d.append(ascii_lowercase[y] + ' ' + line)
+        return d
+
+
+def test_same_as_dict_board():
+    rng = random.Random(1)
+    for _ in range(50):
+        boards = Board(), DictBoard()
+        for _ in range(30):
+            args = rng.randrange(-1, 11), rng.randrange(-1, 11), rng.choice((0, 1)), rng.choice((0, 1)), rng.randrange(6)
+            outcomes = []
+            for b in boards:
+                try:
+                    b.add_ship(*args)
+                    outcomes.append(None)
+                except ValueError as ex:
+                    outcomes.append(str(ex))
+            assert outcomes[0] == outcomes[1]
+        for _ in range(120):
+            x, y = rng.randrange(10), rng.randrange(10)
+            assert boards[0].potshot(x, y) == boards[1].potshot(x, y)
+            assert boards[0].defeated() == boards[1].defeated()
+        assert boards[0].sea == boards[1].sea
+        assert boards[0].lines() == boards[1].lines()
+        assert boards[0].other_lines() == boards[1].other_lines()
+
+
+def test_restores_dict_board_pickle():
+    old = DictBoard()
+    old.add_ship(2, 2, 1, 0, 3)
+    old.potshot(2, 2)
+    old.potshot(0, 0)
+    old.potshot(5, 3)
+    state = pickle.loads(pickle.dumps(old)).__dict__
+
+    b = Board.__new__(Board)
+    b.__setstate__(state)
+    assert b.lines() == old.lines()
+    assert pickle.loads(pickle.dumps(b)).lines() == old.lines()
+
+
+def test_view_follows_changes():
+    b = Board()
+    b.add_ship(2, 2, 1, 0, 3)
+    mine, theirs = BoardView(), BoardView()
+    assert mine.update(b.changes())
+    assert theirs.update(b.changes(hide_ships=True))
+    assert theirs.sea == {}
+
+    b.potshot(2, 2)
+    b.potshot(0, 0)
+    b.potshot(5, 5)
+    assert mine.update(b.changes(mine.version))
+    delta = b.changes(theirs.version, hide_ships=True)
+    assert len(delta['cells']) == 3
+    assert theirs.update(delta)
+    assert mine.lines() == b.lines()
+    assert theirs.lines() == b.other_lines()
+
+    # A view that has missed some changes won't take more
+    stale = BoardView()
+    b.potshot(9, 9)
+    assert not stale.update(b.changes(mine.version))
+    assert stale.update(b.changes())
+    assert stale.lines() == b.lines()
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from battleships import bot
+from battleships.board import Board, BoardView, ships
+
+
+def fleet(seed):
+    rng = random.Random(seed)
+    b = Board()
+    for _, size in ships:
+        p = rng.choice([p for p in bot.placement_table(10, 10, size) if not p.around & b.ships])
+        b.add_ship(p.x, p.y, p.dx, p.dy, p.size)
+    return b
+
+
+def play(b):
+    d = bot.DensityBot(None)
+    d.theirs = BoardView()
+    shots = []
+    while not b.defeated():
+        delta = b.changes(d.theirs.version, hide_ships=True)
+        d.theirs.update(delta)
+        d.learn(delta)
+        shots.append(d.target())
+        b.potshot(*shots[-1])
+    return shots
+
+
+def test_density_bot_sinks_fleet():
+    random.seed(0)
+    for seed in range(5):
+        shots = play(fleet(seed))
+        assert len(shots) == len(set(shots))
+        assert len(shots) < 60
+
+
+@pytest.mark.skipif(bot.numpy is None, reason="needs numpy")
+def test_numpy_density_agrees(monkeypatch):
+    b = fleet(1)
+    random.seed(0)
+    play_to = play(b)[:20]
+
+    b = fleet(1)
+    d = bot.DensityBot(None)
+    d.theirs = BoardView()
+    for x, y in play_to:
+        b.potshot(x, y)
+        delta = b.changes(d.theirs.version, hide_ships=True)
+        d.theirs.update(delta)
+        d.learn(delta)
+        with_numpy = d.density()
+        monkeypatch.setattr(bot, 'numpy', None)
+        assert d.density() == with_numpy
+        monkeypatch.undo()
@@ -0,0 +1,65 @@
+import asyncio
+
+from battleships.board import Board
+from battleships.game import BoardsPlayer, Game
+from remoter.server import Handler
+
+
+def calls(events):
+    # Leaving off the seconds each player has to answer in
+    return {n: e[:3] for n, e in events.items()}
+
+
+def test_resume_from_snapshot():
+    async def run():
+        h = Handler(Game)
+        n = h.new()
+        p1 = h.new_player(n)
+        p2 = h.new_player(n)
+        await asyncio.sleep(0)
+        assert calls(h.player_events(n, p1)) == {1: ('get_ships', (1,), {})}
+
+        # A restarted server picks the game up; the repeated get_ships calls
+        # take over the restored events rather than being sent again.
+        restored = Handler(Game)
+        assert restored.restore(h.snapshot()) == 1
+        for _ in range(3):
+            await asyncio.sleep(0)
+        assert calls(restored.player_events(n, p1)) == {1: ('get_ships', (1,), {})}
+        assert calls(restored.player_events(n, p2)) == {1: ('get_ships', (2,), {})}
+
+        restored.ack_event(n, p1, 1, None)
+        restored.ack_event(n, p2, 1, None)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        call, args, kwargs = calls(restored.player_events(n, p1))[2]
+        assert call == 'guess'
+
+        for i, eh in restored.instances.values():
+            eh.close()
+
+    asyncio.run(run())
+
+
+class Quiet(BoardsPlayer):
+    async def print(self, *args, **kwargs):
+        pass
+
+
+def test_player_catches_up_with_board():
+    async def run():
+        g = Game()
+        g.boards[1], g.boards[2] = Board(), Board()
+        g.boards[1].add_ship(0, 0, 1, 0, 2)
+        g.boards[2].add_ship(5, 5, 0, 1, 3)
+        g.boards[1].potshot(1, 1)
+        g.boards[2].potshot(5, 5)
+
+        # Reconnected, and sent only the latest change
+        p = Quiet(g)
+        await p.update_boards(1, g.boards[1].changes(2), g.boards[2].changes(3, hide_ships=True))
+        assert p.pn == 1
+        assert p.mine.lines() == g.boards[1].lines()
+        assert p.theirs.lines() == g.boards[2].other_lines()
+
+    asyncio.run(run())
@@ -0,0 +1,26 @@
+from battleships.bot import SmarterBot
+from battleships.tournament import run
+
+
+class Twin(SmarterBot):
+    """Plays exactly as SmarterBot does, but is a class of its own"""
+
+
+def test_tournament_is_reproducible():
+    first = run('battleships.bot:SmarterBot', 'battleships.bot:SmarterBot', games=4, workers=1, seed=1, chunk=3)
+    again = run('battleships.bot:SmarterBot', 'battleships.bot:SmarterBot', games=4, workers=1, seed=1)
+    assert first['a']['wins'] + first['b']['wins'] == 4
+    for side in 'ab':
+        assert first[side] == again[side]
+        if first[side]['wins']:
+            assert 17 <= first[side]['mean_shots_to_win'] <= 100
+
+
+def test_mirror_match_credits_seats():
+    # The same games, told apart by class in one and not in the other: each seat must be credited alike
+    mirror = run('battleships.bot:SmarterBot', 'battleships.bot:SmarterBot', games=6, workers=1, seed=3)
+    twins = run('battleships.bot:SmarterBot', 'battleships.test_tournament:Twin', games=6, workers=1, seed=3)
+    for side in 'ab':
+        assert mirror[side]['wins'] == twins[side]['wins']
+        assert mirror[side]['mean_shots_to_win'] == twins[side]['mean_shots_to_win']
+    assert mirror['b']['wins'] > 0
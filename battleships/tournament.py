@@ -0,0 +1,134 @@
+"""Play bots against each other, in-process, to see which is better.
+
+    python -m battleships.tournament --games 5000 battleships.bot:Bot battleships.bot:SmarterBot
+
+Games run directly against a Game, without a server, and are shared out over a pool of processes.
+Game n is seeded with seed + n and the players swap who goes first from one game to the next, so a
+tournament's results don't depend on how many processes play it.
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import multiprocessing
+import os
+import random
+import time
+
+from battleships.game import Game
+
+
+def load(name):
+    """Look up a player class by its 'module:Class' name"""
+    module, _, cls = name.partition(':')
+    return getattr(importlib.import_module(module), cls)
+
+
+_headless = {}
+
+
+def headless(cls):
+    """A subclass of the player class that keeps quiet, counts its shots, and finishes instead of exiting"""
+    try:
+        return _headless[cls]
+    except KeyError:
+        pass
+
+    class Headless(cls):
+        def __init__(self, game=None):
+            super().__init__(game)
+            self.shots = 0
+            self.finished = asyncio.Event()
+
+        async def print(self, *args, **kwargs):
+            pass
+
+        async def exit(self, status):
+            self.finished.set()
+
+        async def guess(self, pn, mine, theirs):
+            self.shots += 1
+            return await super().guess(pn, mine, theirs)
+
+    Headless.__name__ = cls.__name__
+    _headless[cls] = Headless
+    return Headless
+
+
+async def play_game(a, b):
+    """Play one game; returns which player won (0 for a, 1 for b) and the number of shots it took"""
+    g = Game()
+    players = [a(g), b(g)]
+    await asyncio.gather(*(g.new_player(p) for p in players))
+    # The game loop runs on from the last player's setup, and ends by telling both to exit
+    await asyncio.wait_for(asyncio.gather(*(p.finished.wait() for p in players)), 60)
+    winner = players[g.winner - 1]
+    return g.winner - 1, winner.shots
+
+
+async def play_games(a, b, games, seed):
+    results = []
+    for n in games:
+        random.seed(seed + n)
+        # Take turns to go first
+        sides = 'ab' if n % 2 == 0 else 'ba'
+        first, second = (a, b) if sides == 'ab' else (b, a)
+        winner, shots = await play_game(first, second)
+        results.append((sides[winner], shots))
+    return results
+
+
+def play(names, games, seed):
+    """Play the numbered games between the named players; returns (winner, shots) for each"""
+    a, b = (headless(load(name)) for name in names)
+    # The bots narrate every move
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        return asyncio.run(play_games(a, b, games, seed))
+
+
+def run(a, b, games=1000, workers=None, seed=0, chunk=100):
+    """Play a tournament between two player classes, named 'module:Class'; returns the results as a dict"""
+    workers = workers or os.cpu_count()
+    chunks = [range(n, min(n + chunk, games)) for n in range(0, games, chunk)]
+    started = time.perf_counter()
+    if workers == 1:
+        played = [play((a, b), c, seed) for c in chunks]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            played = pool.starmap(play, [((a, b), c, seed) for c in chunks])
+    elapsed = time.perf_counter() - started
+
+    results = {'games': games, 'workers': workers, 'seed': seed, 'elapsed': elapsed, 'games_per_sec': games / elapsed}
+    for side, name in (('a', a), ('b', b)):
+        shots = [s for c in played for winner, s in c if winner == side]
+        results[side] = {
+            'player': name,
+            'wins': len(shots),
+            'win_rate': len(shots) / games,
+            'mean_shots_to_win': sum(shots) / len(shots) if shots else None,
+        }
+    return results
+
+
+def report(results):
+    print('{games} games on {workers} process(es) in {elapsed:.2f}s: {games_per_sec:.1f} games/sec'.format(**results))
+    for side in 'ab':
+        r = results[side]
+        shots = 'n/a' if r['mean_shots_to_win'] is None else '{:.1f}'.format(r['mean_shots_to_win'])
+        print('{player:<32} {wins:>7} wins ({win_rate:6.1%}), {shots} shots to win'.format(shots=shots, **r))
+
+
+def main():
+    p = argparse.ArgumentParser('battour')
+    p.add_argument('a', nargs='?', default='battleships.bot:Bot', help='a player class, as module:Class')
+    p.add_argument('b', nargs='?', default='battleships.bot:SmarterBot', help='its opponent')
+    p.add_argument('--games', type=int, default=1000)
+    p.add_argument('--workers', type=int, help='processes to play on (default: one per CPU)')
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+
+    report(run(args.a, args.b, games=args.games, workers=args.workers, seed=args.seed))
+
+
+if __name__ == '__main__':
+    main()
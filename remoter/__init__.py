@@ -1,11 +1,70 @@
+import asyncio
 import sys
 
 
+class DeadlineExceeded(asyncio.TimeoutError):
+    """A remote call wasn't answered within its deadline"""
+
+
+async def within(aw, deadline, what):
+    """Await aw, cancelling it and raising DeadlineExceeded if it takes more than deadline seconds (if not None)"""
+    if deadline is None:
+        return await aw
+    # Rather than wait_for, which would run aw as a separate task: a player's exit() raises SystemExit,
+    # which must reach the caller, not the event loop.
+    task = asyncio.current_task()
+    # Cancels of the task already in hand (3.11+), so that ours can be told from anyone else's
+    cancelling = task.cancelling() if hasattr(task, 'cancelling') else 0
+    expired = []
+
+    def expire():
+        expired.append(True)
+        task.cancel()
+    timer = asyncio.get_running_loop().call_later(deadline, expire)
+    try:
+        return await aw
+    except asyncio.CancelledError:
+        if not expired:
+            raise
+        if hasattr(task, 'uncancel') and task.uncancel() > cancelling:
+            # The task was cancelled from outside as well, just as the deadline passed
+            raise
+        raise DeadlineExceeded("{} took longer than {}s".format(what, deadline)) from None
+    finally:
+        timer.cancel()
+
+
+def offload(fn=None, *, pool='thread'):
+    """Mark a game method - a plain def, not async def - to run in the server's thread pool (@offload) or
+    process pool (@offload(pool='process')), off the event loop all its games share.
+
+    In a process, the method runs on a copy of the game: only its result comes back.
+    """
+    if pool not in ('thread', 'process'):
+        raise ValueError("Unknown pool {}".format(pool))
+    if fn is None:
+        return lambda fn: offload(fn, pool=pool)
+    fn._offload = pool
+    return fn
+
+
 class BasePlayer:
+    # Seconds to allow each call on the game, unless the call passes its own _deadline; None waits forever
+    deadline = None
+
     def __init__(self, game=None):
         self.game = game
 
-    async def print(self, *args, **kwargs):
+    def batch(self):
+        """Collect calls on the game to make together at the end of an `async with` block: see
+        remoter.client.GameProxy.batch. Works with a game in the same process too."""
+        batch = getattr(type(self.game), 'batch', None)
+        if batch is not None:
+            return self.game.batch()
+        return LocalBatch(self.game)
+
+    # One-way: the game carries on without waiting for it to be printed
+    async def print(self, *args, _ack=False, **kwargs):
         print(*args, **kwargs)
 
     async def input(self, *args, **kwargs):
@@ -13,3 +72,39 @@ class BasePlayer:
 
     async def exit(self, status):
         sys.exit(status)
+
+
+class LocalBatch:
+    """A batch of calls on a game in the same process: they're just made in order at the end of the block"""
+    def __init__(self, game):
+        self.game = game
+        self.calls = []
+
+    def __getattr__(self, call):
+        method = getattr(self.game, call)
+
+        def c(*args, **kwargs):
+            f = asyncio.get_running_loop().create_future()
+            self.calls.append((method, args, kwargs, f))
+            return f
+        return c
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        calls, self.calls = self.calls, []
+        try:
+            while calls and exc_type is None:
+                method, args, kwargs, f = calls.pop(0)
+                try:
+                    f.set_result(await method(*args, **kwargs))
+                except Exception as ex:
+                    # It's raised from the block, so needn't be awaited as well
+                    f.set_exception(ex)
+                    f.exception()
+                    raise
+        finally:
+            # Those after a failure aren't made
+            for _, _, _, f in calls:
+                f.cancel()
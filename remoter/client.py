@@ -1,130 +1,468 @@
 import asyncio
-import inspect
-import json
+import logging
 import sys
+import time
 
 import aiohttp
 
+from remoter import DeadlineExceeded, codec, hooks, within
+from remoter.methods import awaits, check, from_json, lookup, one_way
 import remoter.server
 
+log = logging.getLogger(__name__)
+
 
 class Client:
-    def __init__(self, cls, plr):
+    TRANSPORTS = ('http', 'sync', 'ws')
+
+    # Print the --game and --as options that would reconnect to this game as this player
+    announce = True
+
+    def __init__(self, cls, plr, wait=25, transport='http', validate=False, codec='json', session=None):
         self.cls = cls
         self.plr = plr
         self.url = None
+        # A session shared with other clients (see Host), or None to open our own for each dispatch
+        self.session = session
+        # The server's Unix socket, if it's reached through one rather than TCP
+        self.path = None
+        # Long-running calls awaiting their results, by future id
         self.futures = {}
+        # Results that came back before the call that started them heard its future id, and how
+        # many such calls are still waiting to
+        self.early = {}
+        self.posting = 0
+        # How long to ask the server to park an idle poll for
+        self.wait = wait
+        if transport not in Client.TRANSPORTS:
+            raise ValueError("Unknown transport {}".format(transport))
+        self.transport = transport
+        self.codec = remoter.codec.get(codec)
+        # The websocket, once one is open; outstanding calls made over it, by request id
+        self.ws = None
+        self.calls = {}
+        self.last_call = 0
+        # Event results waiting to go out with the next sync, when using that transport
+        self.acks = None
+        # Check game calls against the server's published method table before sending them
+        self.validate = validate
+        self.methods = None
 
-    def run(self, host='localhost', port=8080, game=None, pid=None):
-        self.url = 'http://{}:{}/{}.{}'.format(host, port, self.cls.__module__, self.cls.__name__)
+    def run(self, host='localhost', port=8080, game=None, pid=None, path=None):
+        self.connect(host, port, path)
 
         asyncio.run(self.dispatch(game, pid))
         sys.exit(self.exit_code)
 
+    def connect(self, host='localhost', port=8080, path=None):
+        """Point the client at a server, before dispatch(): at host:port, or at the Unix socket path"""
+        if path is not None:
+            host, port = 'localhost', 80
+        self.url = 'http://{}:{}/{}.{}'.format(host, port, self.cls.__module__, self.cls.__name__)
+        self.path = path
+
     async def dispatch(self, game, pid):
-        self.session = aiohttp.ClientSession()
-        async with self.session:
+        """Play until the player exits, and return its exit code"""
+        if self.session is not None:
+            return await self.play(game, pid)
+        connector = aiohttp.UnixConnector(path=self.path) if self.path is not None else None
+        async with aiohttp.ClientSession(connector=connector) as self.session:
+            try:
+                return await self.play(game, pid)
+            finally:
+                self.session = None
 
-            # Make a new game, if required
-            if game is None:
-                game = await self.post()
-                pid = None
+    async def play(self, game, pid):
+        if self.validate:
+            self.methods = from_json(await self.get('methods'))
+
+        # Make a new game, if required
+        if game is None:
+            game = await self.post()
+            pid = None
+            if self.announce:
                 print("--game", game)
 
-            # Make a new PID, if required
-            if pid is None:
-                pid = await self.post(game, 'player')
+        # Calls the game makes on the player without waiting to hear back
+        self.one_way = frozenset(one_way(self.plr))
+
+        # Make a new PID, if required
+        if pid is None:
+            pid = await self.post(game, 'player', args={'one_way': sorted(self.one_way)} if self.one_way else None)
+            if self.announce:
                 print("--as", pid)
 
-            g = GameProxy(self, game, pid, cls=self.cls)
-            plr = self.plr(g)
-            self.game = game
-            self.pid = pid
+        g = GameProxy(self, game, pid, cls=self.cls)
+        plr = self.plr(g)
+        self.game = game
+        self.pid = pid
+
+        self.in_flight = set()
+        self.completed = set()
+        # The highest-numbered event received so far. Polls only ask for
+        # events after this, so a reconnecting player (which starts from
+        # zero) is sent just the events that are still unacknowledged.
+        self.seen = 0
+
+        self.exit_code = None
+        if self.transport == 'ws':
+            await self.dispatch_socket(plr)
+        elif self.transport == 'sync':
+            await self.dispatch_sync(plr)
+        else:
+            await self.dispatch_poll(plr)
+        return self.exit_code
+
+    async def dispatch_poll(self, plr):
+        game, pid = self.game, self.pid
 
-            self.in_flight = set()
+        # Poll and dispatch events. When the last poll turned nothing up,
+        # ask the server to hold the request open until there's news.
+        wait = 0
+        while self.exit_code is None:
+            started = time.monotonic()
+            events = await self.get(game, 'player', pid, 'e', params=self.poll_params(wait))
+            futures = await self.get(game, 'player', pid, 'f')
+            launched = await self.launch(plr, events)
+
+            if futures != {}:
+                log.debug("futures: %s", futures)
+                for k, r in futures.items():
+                    k = int(k)
+                    launched = True
+                    self.settle(k, r)
+                    await self.delete(game, 'player', pid, 'f', k)
+
+            self.in_flight.difference_update(self.completed)
+            self.completed = set()
+
+            if not launched and wait and time.monotonic() - started < 1:
+                # The server didn't park the request: it predates long-polling
+                await asyncio.sleep(1)
+            wait = 0 if launched else self.wait
+
+    async def dispatch_sync(self, plr):
+        game, pid = self.game, self.pid
+
+        # One request per round: it carries the results of the events we ran
+        # inline and the futures we consumed, and brings back whatever is pending.
+        self.acks = {}
+        consumed = []
+        wait = 0
+        while self.exit_code is None:
+            started = time.monotonic()
+            acks, self.acks = self.acks, {}
+            pending = await self.post(game, 'player', pid, 'sync', args={'acks': acks, 'futures': consumed},
+                                      params=self.poll_params(wait))
+            consumed = []
+
+            launched = await self.launch(plr, pending['events'])
+            for k, r in pending['futures'].items():
+                k = int(k)
+                launched = True
+                self.settle(k, r)
+                consumed.append(k)
+
+            self.in_flight.difference_update(self.completed)
             self.completed = set()
+            if not launched and not self.acks and wait and time.monotonic() - started < 1:
+                # The server didn't park the request, as it should have
+                await asyncio.sleep(1)
+            wait = 0 if launched or self.acks else self.wait
+
+        # Flush the final acknowledgements, including the one for the exit
+        if self.acks or consumed:
+            await self.post(game, 'player', pid, 'sync', args={'acks': self.acks, 'futures': consumed})
+
+    def poll_params(self, wait):
+        params = {'since': self.seen}
+        if wait:
+            params['wait'] = wait
+        return params
 
-            self.exit_code = None
-            # Poll and dispatch events
-            while self.exit_code is None:
-                events = await self.get(game, 'player', pid, 'e')
-                futures = await self.get(game, 'player', pid, 'f')
-                launched = False
-
-                if events != {}:
-                    for k, ev in sorted((int(k), e) for k, e in events.items()):
-                        if k not in self.in_flight:
-                            # Do we run this inline or as a coroutine?
-                            try:
-                                _await = inspect.signature(getattr(plr, ev[0])).parameters['_await'].default
-                            except (AttributeError, TypeError, KeyError):
-                                # By default, we 'synchronously' call the server
-                                _await = True
-                            if _await:
-                                await self.handle_event(k, plr, ev[0], ev[1], ev[2])
-                            else:
-                                self.in_flight.add(k)
-                                asyncio.create_task(self.handle_event(k, plr, ev[0], ev[1], ev[2]))
-                            launched = True
-                if futures != {}:
-                    print("futures:", futures)
-                    for k, r in futures.items():
-                        k = int(k)
-                        launched = True
-                        self.futures[k].set_result(r)
-                        await self.delete(game, 'player', pid, 'f', k)
-                        del self.futures[k]
-
-                self.in_flight.difference_update(self.completed)
-                self.completed = set()
-
-                if not launched:
-                    await asyncio.sleep(1)
-
-    async def handle_event(self, key, plr, call, args, kwargs):
-        print("launching", key, call, args, kwargs)
+    async def launch(self, plr, events):
+        launched = False
+        for k, ev in sorted((int(k), e) for k, e in events.items()):
+            self.seen = max(self.seen, k)
+            if k not in self.in_flight:
+                deadline = ev[3] if len(ev) > 3 else None
+                # Do we run this inline or as a coroutine?
+                if awaits(type(plr), ev[0]):
+                    await self.handle_event(k, plr, ev[0], ev[1], ev[2], deadline)
+                else:
+                    self.in_flight.add(k)
+                    asyncio.create_task(self.handle_event(k, plr, ev[0], ev[1], ev[2], deadline))
+                launched = True
+        return launched
+
+    async def dispatch_socket(self, plr):
+        # Events, event acks and game calls all share one websocket.
+        # Incoming events are queued so that the reader stays free to pick up
+        # the results of any game calls the player makes while handling them.
+        self.stopped = asyncio.Event()
+        queue = asyncio.Queue()
+        url = '{}/{}/player/{}/ws'.format(self.url, self.game, self.pid)
+        async with self.session.ws_connect(url, protocols=[codec.protocol(self.codec)]) as ws:
+            if codec.for_protocol(ws.protocol) is not self.codec:
+                # An older server that doesn't negotiate: it can only speak JSON
+                self.codec = codec.JSON
+            self.ws = ws
+            tasks = [asyncio.create_task(self.read_socket(ws, queue)),
+                     asyncio.create_task(self.run_events(plr, queue)),
+                     asyncio.create_task(self.stopped.wait())]
+            try:
+                await asyncio.wait([tasks[0], tasks[2]], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for t in tasks:
+                    t.cancel()
+                self.ws = None
+
+        for f in self.calls.values():
+            f.cancel()
+        self.calls = {}
+
+    async def read_socket(self, ws, queue):
+        async for msg in ws:
+            if msg.type not in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                continue
+            m = self.codec.loads(msg.data)
+            if m['op'] == 'event':
+                queue.put_nowait((m['id'], m['call'], m['args'], m['kwargs'], m.get('deadline')))
+            elif m['op'] == 'return':
+                f = self.calls.pop(m['id'], None)
+                if f is None or f.done():
+                    continue
+                if 'error' in m:
+                    f.set_exception(RuntimeError(m['error']))
+                else:
+                    f.set_result(m.get('result'))
+
+    async def run_events(self, plr, queue):
+        while True:
+            k, call, args, kwargs, deadline = await queue.get()
+            if awaits(type(plr), call):
+                await self.handle_event(k, plr, call, args, kwargs, deadline)
+            else:
+                asyncio.create_task(self.handle_event(k, plr, call, args, kwargs, deadline))
+
+    async def handle_event(self, key, plr, call, args, kwargs, deadline=None):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("launching %d %s %s %s", key, call, args, kwargs, extra={'event': key, 'call': call})
+        h = hooks.start('client', 'player', call, args, kwargs)
+        if call in self.one_way:
+            # Nobody is waiting on the result, so there is nothing to send back
+            try:
+                await getattr(plr, call)(*args, **kwargs)
+                hooks.finish(h, 'ok')
+            except Exception:
+                log.warning("one-way player event %s failed", call, exc_info=True)
+                hooks.finish(h, 'error')
+            self.finished(key)
+            return
         try:
-            result = await getattr(plr, call)(*args, **kwargs)
-            await self.post(self.game, 'player', self.pid, 'e', key, args=result)
+            result = await within(getattr(plr, call)(*args, **kwargs), deadline, call)
+            hooks.finish(h, 'ok')
+            await self.ack(key, result)
+        except DeadlineExceeded:
+            # The game has stopped waiting, and withdrawn the call: there's nobody to tell
+            log.warning("gave up on player event %s after its %.3gs deadline", call, deadline)
+            hooks.finish(h, 'timeout')
         except SystemExit as ex:
-            await self.post(self.game, 'player', self.pid, 'e', key, args=str(ex))
+            hooks.finish(h, 'exit')
+            await self.ack(key, str(ex))
             self.exit_code = ex.code
+            if self.ws is not None:
+                self.stopped.set()
         except Exception as ex:
-            # print("exception occurred handling player event", call, ex)
-            await self.post(self.game, 'player', self.pid, 'e', key, args=str(ex))
-        self.completed.add(key)
+            log.debug("exception handling player event %s", call, exc_info=True)
+            hooks.finish(h, 'error')
+            await self.ack(key, str(ex))
+        self.finished(key)
 
-    async def post(self, *path, args=None, headers=None):
-        path = '/'.join(str(p) for p in path)
-        if path != '':
-            path = '/' + path
-        try:
-            async with self.session.post(self.url + path, json=args, headers=headers) as resp:
-                return await resp.json()
-        except json.decoder.JSONDecodeError:
-            return None
+    def finished(self, key):
+        # The poll and sync loops drop finished events from in_flight once they've polled past them;
+        # events run inline, and those from a websocket, are never in it
+        if key in self.in_flight:
+            self.completed.add(key)
 
-    async def get(self, *path):
-        path = '/'.join(str(p) for p in path)
-        if path != '':
-            path = '/' + path
-        try:
-            async with self.session.get(self.url + path) as resp:
-                return await resp.json()
-        except json.decoder.JSONDecodeError:
-            return None
+    async def ack(self, key, result):
+        if self.ws is not None:
+            await codec.send(self.ws, self.codec, {'op': 'ack', 'id': key, 'result': result})
+        elif self.acks is not None and key not in self.in_flight:
+            # Results of inline events ride along with the next sync. Those of
+            # long-running events can't wait: a sync may be parked on them.
+            self.acks[key] = result
+        else:
+            await self.post(self.game, 'player', self.pid, 'e', key, args=result)
+
+    async def call(self, game, pid, method, args, _await=True, deadline=None):
+        """Invoke a method on the remote game instance.
+
+        With a deadline, give up (raising DeadlineExceeded) after that many seconds; the server
+        is told, and cancels the method too.
+        """
+        if self.ws is not None:
+            # Results come back asynchronously over the socket, whichever way the method is marked
+            self.last_call += 1
+            n = self.last_call
+            f = self.calls[n] = asyncio.get_running_loop().create_future()
+            msg = {'op': 'call', 'id': n, 'method': method, 'args': args}
+            if deadline is not None:
+                msg['deadline'] = deadline
+            await codec.send(self.ws, self.codec, msg)
+            try:
+                return await within(f, deadline, method)
+            finally:
+                self.calls.pop(n, None)
+        headers = {}
+        if deadline is not None:
+            headers[remoter.server.Server.DEADLINE_HEADER] = str(deadline)
+        if _await:
+            return await within(self.post(game, method, args=args, headers=headers), deadline, method)
+        else:
+            # print("triggering a future")
+            headers[remoter.server.Server.REMOTER_HEADER] = str(pid)
+            self.posting += 1
+            try:
+                fid = await self.post(game, method, args=args, headers=headers)
+            finally:
+                self.posting -= 1
+            # print("fid=", fid, type(fid))
+            f = asyncio.Future()
+            if fid in self.early:
+                f.set_result(self.early.pop(fid))
+            if not self.posting:
+                # Whatever's left belongs to calls that gave up waiting
+                self.early.clear()
+            self.futures[fid] = f
+            try:
+                result = await within(f, deadline, method)
+            finally:
+                self.futures.pop(fid, None)
+            # print("future returns", result)
+            return result
+
+    def settle(self, fid, result):
+        """Hand the result of a long-running call to the call waiting for it"""
+        f = self.futures.pop(fid, None)
+        if f is not None:
+            f.set_result(result)
+        elif self.posting:
+            # The call may not have heard back its future id yet
+            self.early[fid] = result
+        # Otherwise the call has given up waiting for it
+
+    async def call_batch(self, game, calls):
+        """Invoke several methods on the remote game instance, in order, in one go"""
+        if self.ws is not None:
+            self.last_call += 1
+            n = self.last_call
+            f = self.calls[n] = asyncio.get_running_loop().create_future()
+            await codec.send(self.ws, self.codec, {'op': 'batch', 'id': n, 'calls': calls})
+            return await f
+        return await self.post(game, 'batch', args=calls)
+
+    async def post(self, *path, args=None, headers=None, params=None):
+        return await self.request('POST', path, args=args, headers=headers, params=params)
+
+    async def get(self, *path, params=None):
+        return await self.request('GET', path, params=params)
 
     async def delete(self, *path):
+        return await self.request('DELETE', path)
+
+    async def request(self, method, path, args=None, headers=None, params=None):
         path = '/'.join(str(p) for p in path)
         if path != '':
             path = '/' + path
+        headers = dict(headers or {}, Accept=self.codec.content_type)
+        data = None
+        if args is not None:
+            data = self.codec.dumps(args)
+            headers['Content-Type'] = self.codec.content_type
+        async with self.session.request(method, self.url + path, data=data, headers=headers, params=params) as resp:
+            body = await resp.read()
+            if resp.status >= 400:
+                raise RuntimeError("{} {}: {}".format(resp.status, resp.reason, body.decode(errors='replace')))
+        if not body:
+            return None
         try:
-            async with self.session.delete(self.url + path) as resp:
-                return await resp.json()
-        except json.decoder.JSONDecodeError:
+            return codec.for_content_type(resp.content_type, codec.JSON).loads(body)
+        except ValueError:
             return None
 
 
+class Host:
+    """Runs many players in one process, on one event loop, over one pool of kept-alive connections.
+
+        async with Host('localhost', 8080) as host:
+            game = await host.new_game(Game)
+            codes = await asyncio.gather(host.play(Client(Game, Bot), game), host.play(Client(Game, Bot), game))
+
+    A player exiting ends only its own Client's dispatch. limit and limit_per_host cap the connections
+    in the pool (0 for no limit); with the http and sync transports each player parks one connection on a
+    long poll, and with ws each holds its socket, so they should allow a connection per player to spare.
+    With path, the server is reached over that Unix socket instead of at host:port.
+    """
+    def __init__(self, host='localhost', port=8080, limit=0, limit_per_host=0, keepalive_timeout=60, path=None):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.connector_options = dict(limit=limit, limit_per_host=limit_per_host, keepalive_timeout=keepalive_timeout)
+        self.session = None
+
+    async def __aenter__(self):
+        if self.path is not None:
+            connector = aiohttp.UnixConnector(path=self.path, **self.connector_options)
+        else:
+            connector = aiohttp.TCPConnector(**self.connector_options)
+        self.session = aiohttp.ClientSession(connector=connector)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+
+    def adopt(self, client):
+        client.connect(self.host, self.port, self.path)
+        client.session = self.session
+        client.announce = False
+        return client
+
+    async def new_game(self, cls):
+        return await self.adopt(Client(cls, None)).post()
+
+    async def play(self, client, game=None, pid=None):
+        """Play as a Client's player until it exits; returns its exit code"""
+        try:
+            return await self.adopt(client).dispatch(game, pid)
+        finally:
+            client.session = None
+
+
+async def play_many(host, cls, plr, players, per_game=2, rounds=1, game=None, **kwargs):
+    """Play players (instances of plr) on a Host, per_game to each new game, for a number of rounds.
+
+    Or with game, have them all join that one. Further keyword arguments go to each Client.
+    Returns the players' exit codes, or the exceptions that ended them.
+    """
+    async def group(n):
+        codes = []
+        for _ in range(rounds if game is None else 1):
+            g = game if game is not None else await host.new_game(cls)
+            codes += await asyncio.gather(*(host.play(Client(cls, plr, **kwargs), g) for _ in range(n)),
+                                          return_exceptions=True)
+        return codes
+
+    per_game = players if game is not None else per_game
+    groups = [min(per_game, players - n) for n in range(0, players, per_game)]
+    codes = [c for codes in await asyncio.gather(*(group(n) for n in groups)) for c in codes]
+    for c in codes:
+        if isinstance(c, BaseException):
+            log.error("player failed: %r", c)
+    return codes
+
+
 class GameProxy:
     def __init__(self, client, game, pid, cls=None):
         self.__client = client
@@ -132,26 +470,127 @@ class GameProxy:
         self.__pid = pid
         self.__cls = cls
 
+    def batch(self):
+        """Collect game calls to send together, in one request, at the end of the block:
+
+            async with self.game.batch() as batch:
+                placed = batch.add_ship(pn, 0, 0, 1, 0, 5)
+                board = batch.my_board(pn)
+            print(placed.result(), board.result())
+
+        Calls in the batch return futures, and are run in order; if one fails, the rest aren't run
+        and leaving the block raises its error.
+        """
+        return Batch(self.__client, self.__game, self.__cls)
+
     def __getattr__(self, call):
+        # Only reached the first time each method is used: the proxy method
+        # is remembered on the instance afterwards.
+        methods = self.__client.methods
+        if methods is not None:
+            m = methods.get(call)
+            if m is None:
+                raise AttributeError("{} has no remote method {}".format(self.__cls.__name__, call))
+        else:
+            m = lookup(self.__cls, call)
         # Check the method to see if it has a default for _await
-        try:
-            _await = inspect.signature(getattr(self.__cls, call)).parameters['_await'].default
-        except (AttributeError, TypeError, KeyError):
-            # By default, we 'synchronously' call the server
-            _await = True
+        _await = True if m is None else m.awaits
+        client, game, pid = self.__client, self.__game, self.__pid
+        # The player class's default deadline for its calls on the game
+        deadline = getattr(client.plr, 'deadline', None)
 
-        async def c(*args, _await=_await, **kwargs):
+        validate = methods is not None
+
+        async def c(*args, _await=_await, _deadline=deadline, **kwargs):
+            if validate:
+                check(m, args, kwargs)
+            h = hooks.start('client', 'game', call, args, kwargs)
             if len(args) > 0:
                 kwargs[''] = args
-            if _await:
-                return await self.__client.post(self.__game, call, args=kwargs)
-            else:
-                # print("triggering a future")
-                fid = await self.__client.post(self.__game, call, args=kwargs, headers={remoter.server.Server.REMOTER_HEADER: str(self.__pid)})
-                # print("fid=", fid, type(fid))
-                f = asyncio.Future()
-                self.__client.futures[fid] = f
-                result = await f
-                # print("future returns", result)
+            outcome = 'error'
+            try:
+                result = await client.call(game, pid, call, kwargs, _await=_await, deadline=_deadline)
+                outcome = 'ok'
                 return result
+            except asyncio.CancelledError:
+                outcome = 'cancelled'
+                raise
+            except DeadlineExceeded:
+                outcome = 'timeout'
+                raise
+            finally:
+                hooks.finish(h, outcome)
+        c.__name__ = call
+        setattr(self, call, c)
+        return c
+
+
+class Batch:
+    def __init__(self, client, game, cls):
+        self.__client = client
+        self.__game = game
+        self.__cls = cls
+        # [method, args] and a future for the result of each call so far
+        self.calls = []
+        self.futures = []
+
+    def __getattr__(self, call):
+        methods = self.__client.methods
+        if methods is not None:
+            m = methods.get(call)
+            if m is None:
+                raise AttributeError("{} has no remote method {}".format(self.__cls.__name__, call))
+        else:
+            m = lookup(self.__cls, call)
+        if m is not None and not m.awaits:
+            raise TypeError("{} runs in the background, so can't be batched".format(call))
+
+        def c(*args, **kwargs):
+            if methods is not None:
+                check(m, args, kwargs)
+            f = asyncio.get_running_loop().create_future()
+            f.hook = hooks.start('client', 'game', call, args, kwargs)
+            if len(args) > 0:
+                kwargs[''] = args
+            self.calls.append([call, kwargs])
+            self.futures.append(f)
+            return f
         return c
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.send()
+        else:
+            for f in self.futures:
+                hooks.finish(f.hook, 'cancelled')
+                f.cancel()
+
+    async def send(self):
+        calls, futures = self.calls, self.futures
+        self.calls, self.futures = [], []
+        if not calls:
+            return
+        try:
+            reply = await self.__client.call_batch(self.__game, calls)
+        except BaseException:
+            for f in futures:
+                hooks.finish(f.hook, 'error')
+                f.cancel()
+            raise
+        results = reply['results']
+        for f, r in zip(futures, results):
+            hooks.finish(f.hook, 'ok')
+            f.set_result(r)
+        if 'error' in reply:
+            failed = futures[len(results)]
+            hooks.finish(failed.hook, 'error')
+            failed.set_exception(RuntimeError(reply['error']))
+            # It's raised from the block, so needn't be awaited as well
+            failed.exception()
+            for f in futures[len(results) + 1:]:
+                hooks.finish(f.hook, 'cancelled')
+                f.cancel()
+            raise RuntimeError(reply['error'])
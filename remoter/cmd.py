@@ -1,34 +1,135 @@
 import argparse
+import asyncio
+import logging
+import sys
 
+import remoter.codec
+import remoter.lifecycle
 import remoter.server
+import remoter.shard
 import remoter.client
 
 
+LOG_LEVELS = ('debug', 'info', 'warning', 'error')
+
+
+def log_level(p, default):
+    p.add_argument('--log-level', choices=LOG_LEVELS, default=default, help='least severe messages to log')
+
+
+def configure_logging(level):
+    logging.basicConfig(level=level.upper(), format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    if level != 'debug':
+        # One line per request drowns everything else out
+        logging.getLogger('aiohttp.access').setLevel(logging.WARNING)
+
+
 def server(*cls):
     p = argparse.ArgumentParser('remoter-server')
     p.add_argument('--host', default='0.0.0.0')
     p.add_argument('--port', type=int, default=8080)
+    p.add_argument('--unix', metavar='PATH', help='listen on this Unix socket instead of host:port')
+    p.add_argument('--max-wait', type=float, default=30, help='longest time to park a long-poll request')
+    p.add_argument('--no-websocket', dest='websocket', action='store_false',
+                   help='only serve the plain HTTP routes')
+    p.add_argument('--workers', type=int, default=1, help='serve games from this many processes')
+    p.add_argument('--placement', choices=remoter.shard.Router.PLACEMENTS, default='round-robin',
+                   help='with --workers, how to share new games out between them')
+    p.add_argument('--shard', type=int, default=0, help='as a backend of remoter-router, this one\'s index')
+    p.add_argument('--shards', type=int, default=1, help='as a backend of remoter-router, how many backends it has')
+    p.add_argument('--idle-ttl', type=float, default=3600, help='evict games and players idle for this long')
+    p.add_argument('--finished-ttl', type=float, default=60, help='evict finished games after this long')
+    p.add_argument('--max-games', type=int, help='refuse new games beyond this many (per worker)')
+    p.add_argument('--snapshot', help='save games to this file, and restore them from it at startup')
+    p.add_argument('--snapshot-interval', type=float, default=10, help='seconds between snapshots')
+    p.add_argument('--max-events', type=int, help='most calls on one player that may await acknowledgement')
+    p.add_argument('--max-futures', type=int, help="most long-running calls' results one player may leave uncollected")
+    p.add_argument('--overflow', choices=remoter.lifecycle.FlowControl.OVERFLOW, default='wait',
+                   help='when a player is at a limit, make the caller wait for room or fail the call')
+    p.add_argument('--threads', type=int, help='size of the thread pool for offloaded game methods (per worker)')
+    p.add_argument('--processes', type=int, default=0,
+                   help="size of the process pool for game methods offloaded to one (per worker; "
+                        "by default they run in the thread pool)")
+    log_level(p, 'info')
     args = p.parse_args()
+    configure_logging(args.log_level)
+
+    options = dict(max_wait=args.max_wait, websocket=args.websocket,
+                   idle_ttl=args.idle_ttl, finished_ttl=args.finished_ttl, max_games=args.max_games,
+                   snapshot=args.snapshot, snapshot_interval=args.snapshot_interval,
+                   max_events=args.max_events, max_futures=args.max_futures, overflow=args.overflow,
+                   threads=args.threads, processes=args.processes)
+
+    # aiohttp serves TCP as well as the socket if it's given a host or port
+    address = dict(path=args.unix) if args.unix else dict(host=args.host, port=args.port)
+
+    if args.workers > 1:
+        remoter.shard.run(cls, args.workers, placement=args.placement, **address, **options)
+        return
 
-    srv = remoter.server.Server()
+    srv = remoter.server.Server(shard=args.shard, shards=args.shards, **options)
 
     for c in cls:
         srv.register(c)
 
-    srv.run(host=args.host, port=args.port)
+    srv.run(**address)
+
+
+def router():
+    p = argparse.ArgumentParser('remoter-router')
+    p.add_argument('backends', nargs='+', metavar='BACKEND',
+                   help='the base URL (or unix:<path>) of each backend server, in the order of their --shard')
+    p.add_argument('--host', default='0.0.0.0')
+    p.add_argument('--port', type=int, default=8080)
+    p.add_argument('--unix', metavar='PATH', help='listen on this Unix socket instead of host:port')
+    p.add_argument('--placement', choices=remoter.shard.Router.PLACEMENTS, default='load',
+                   help='how to choose a backend for each new game')
+    p.add_argument('--refresh', type=float, default=5, help='seconds between readings of the backends\' load')
+    log_level(p, 'info')
+    args = p.parse_args()
+    configure_logging(args.log_level)
+
+    r = remoter.shard.Router([remoter.shard.backend(b) for b in args.backends],
+                             placement=args.placement, refresh=args.refresh)
+    if args.unix:
+        r.run(path=args.unix)
+    else:
+        r.run(host=args.host, port=args.port)
 
 
 def client(cls, plr):
     p = argparse.ArgumentParser('remoter-client')
     p.add_argument('--host', default='localhost')
     p.add_argument('--port', type=int, default=8080)
+    p.add_argument('--unix', metavar='PATH', help="connect to the server's Unix socket instead of host:port")
     p.add_argument('--game', type=int)
     p.add_argument('--as', dest='pid', type=int)
+    p.add_argument('--wait', type=float, default=25, help='how long to long-poll the server for events')
+    p.add_argument('--transport', choices=remoter.client.Client.TRANSPORTS, default='http')
+    p.add_argument('--validate', action='store_true', help="check calls against the server's method table")
+    p.add_argument('--codec', choices=sorted(remoter.codec.CODECS), default='json', help='wire format')
+    p.add_argument('--players', type=int, default=1, help='play this many players from this one process')
+    p.add_argument('--per-game', type=int, default=2, help='with --players, how many to put in each new game')
+    p.add_argument('--rounds', type=int, default=1, help='with --players, how many games each plays in turn')
+    p.add_argument('--connections', type=int, default=0,
+                   help='with --players, the most connections to hold open (0 for no limit)')
+    log_level(p, 'warning')
     args = p.parse_args()
+    configure_logging(args.log_level)
+
+    options = dict(wait=args.wait, transport=args.transport, validate=args.validate, codec=args.codec)
+
+    if args.players > 1:
+        async def play():
+            async with remoter.client.Host(args.host, args.port, limit=args.connections, path=args.unix) as host:
+                return await remoter.client.play_many(host, cls, plr, args.players, per_game=args.per_game,
+                                                      rounds=args.rounds, game=args.game, **options)
+        codes = asyncio.run(play())
+        sys.exit(0 if all(c in (0, None) for c in codes) else 1)
 
-    cli = remoter.client.Client(cls, plr)
+    cli = remoter.client.Client(cls, plr, **options)
 
-    cli.run(host=args.host, port=args.port, game=args.game, pid=args.pid)
+    cli.run(host=args.host, port=args.port, game=args.game, pid=args.pid, path=args.unix)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,90 @@
+from collections import namedtuple
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+# dumps: object -> bytes; loads: bytes (or str, for text codecs) -> object.
+# Binary codecs travel in binary websocket frames, text ones in text frames.
+Codec = namedtuple('Codec', ['name', 'content_type', 'dumps', 'loads', 'binary'])
+
+# name -> Codec, and content type -> Codec
+CODECS = {}
+_content_types = {}
+
+
+def register(codec):
+    CODECS[codec.name] = codec
+    _content_types[codec.content_type] = codec
+
+
+def get(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError("Unknown or unavailable codec {}".format(name))
+
+
+def for_content_type(content_type, default=None):
+    """Return the codec for a Content-Type (or Accept) header value"""
+    if content_type:
+        for ct in content_type.split(','):
+            codec = _content_types.get(ct.split(';')[0].strip())
+            if codec is not None:
+                return codec
+    return default
+
+
+if orjson is not None:
+    # Event numbers and the like are used as mapping keys
+    JSON = Codec('json', 'application/json',
+                 lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+                 orjson.loads,
+                 False)
+else:
+    JSON = Codec('json', 'application/json',
+                 lambda obj: json.dumps(obj, separators=(',', ':')).encode(),
+                 json.loads,
+                 False)
+register(JSON)
+
+if msgpack is not None:
+    register(Codec('msgpack', 'application/msgpack',
+                   lambda obj: msgpack.packb(obj, use_bin_type=True),
+                   lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False),
+                   True))
+
+if cbor2 is not None:
+    register(Codec('cbor', 'application/cbor', cbor2.dumps, cbor2.loads, True))
+
+
+# Over a websocket, the codec is negotiated as a subprotocol
+def protocol(codec):
+    return 'remoter.' + codec.name
+
+
+def for_protocol(proto, default=None):
+    if proto and proto.startswith('remoter.'):
+        return CODECS.get(proto[len('remoter.'):], default)
+    return default
+
+
+async def send(ws, codec, obj):
+    data = codec.dumps(obj)
+    if codec.binary:
+        await ws.send_bytes(data)
+    else:
+        await ws.send_str(data.decode())
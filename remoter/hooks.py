@@ -0,0 +1,81 @@
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class Hook:
+    def __init__(self, before=None, after=None):
+        self.before = before
+        self.after = after
+
+
+class Call:
+    """One remote call, as seen by the hooks.
+
+    side is 'server' or 'client'; target is 'game' (a Player calling the Game) or 'player'
+    (the Game calling a Player). After the call, duration holds the elapsed seconds and
+    outcome is one of 'ok', 'error', 'cancelled', 'timeout' or 'exit'.
+    """
+    __slots__ = ('side', 'target', 'method', 'args', 'kwargs', 'started', 'duration', 'outcome')
+
+    def __init__(self, side, target, method, args, kwargs):
+        self.side = side
+        self.target = target
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.started = time.perf_counter()
+        self.duration = None
+        self.outcome = None
+
+    @property
+    def size(self):
+        """How many arguments were passed"""
+        return len(self.args) + len(self.kwargs)
+
+
+_hooks = []
+
+
+def add(before=None, after=None):
+    """Register callables to be run with a Call before and after every remote call.
+
+    Returns a handle for remove().
+    """
+    hook = Hook(before, after)
+    _hooks.append(hook)
+    return hook
+
+
+def remove(hook):
+    _hooks.remove(hook)
+
+
+def start(side, target, method, args, kwargs):
+    # Nothing to do (or allocate) unless someone is listening
+    if not _hooks:
+        return None
+    call = Call(side, target, method, args, kwargs)
+    for hook in _hooks:
+        if hook.before is not None:
+            run(hook.before, call)
+    return call
+
+
+def finish(call, outcome):
+    if call is None:
+        return
+    call.duration = time.perf_counter() - call.started
+    call.outcome = outcome
+    for hook in reversed(_hooks):
+        if hook.after is not None:
+            run(hook.after, call)
+
+
+def run(fn, call):
+    # A broken hook mustn't break the call it's watching
+    try:
+        fn(call)
+    except Exception:
+        log.exception("hook %r failed on %s", fn, call.method)
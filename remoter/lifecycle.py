@@ -0,0 +1,106 @@
+import asyncio
+from collections import Counter
+import logging
+import time
+
+from remoter import metrics
+
+log = logging.getLogger(__name__)
+
+
+class TooManyGames(Exception):
+    pass
+
+
+class TooManyCalls(Exception):
+    pass
+
+
+class NotFound(KeyError):
+    """No such game or player: it was never there, or it has been evicted"""
+
+
+class Lifecycle:
+    """Keep the server's memory bounded.
+
+    Games nobody has touched for idle_ttl seconds, and games whose players have all been
+    sent an exit and that have been quiet for finished_ttl seconds, are evicted; so are
+    players who have not been heard from for idle_ttl, and future results left uncollected
+    for that long. New games are refused once max_games are live. Requests for a game or
+    player that has been evicted are answered with a 404.
+    """
+    def __init__(self, idle_ttl=3600, finished_ttl=60, max_games=None, interval=30):
+        self.idle_ttl = idle_ttl
+        self.finished_ttl = finished_ttl
+        self.max_games = max_games
+        self.interval = interval
+        # Running totals of everything swept up
+        self.reclaimed = Counter()
+
+    def admit(self, handlers):
+        if self.max_games is not None and sum(len(h.instances) for h in handlers) >= self.max_games:
+            raise TooManyGames("Too many games in progress ({}); try again later".format(self.max_games))
+
+    def sweep(self, handlers, now=None):
+        """Evict whatever has expired; return a Counter of what was reclaimed"""
+        if now is None:
+            now = time.monotonic()
+        reclaimed = Counter()
+        for h in handlers:
+            for instance, (i, eh) in list(h.instances.items()):
+                if eh.finished():
+                    ttl = self.finished_ttl
+                else:
+                    ttl = self.idle_ttl
+                # Every request for the game or its players counts as activity
+                if eh.last_active < now - ttl:
+                    reclaimed += h.evict(instance)
+                    continue
+
+                for pid, r in list(eh.events.items()):
+                    if r.last_active < now - self.idle_ttl:
+                        reclaimed += eh.evict_player(pid)
+                    else:
+                        reclaimed['futures'] += r.expire_futures(now - self.idle_ttl)
+
+        reclaimed = +reclaimed
+        self.reclaimed += reclaimed
+        return reclaimed
+
+    async def run(self, handlers):
+        while True:
+            await asyncio.sleep(self.interval)
+            reclaimed = self.sweep(handlers)
+            if reclaimed:
+                log.info("reclaimed %s", ', '.join('{} {}'.format(n, k) for k, n in sorted(reclaimed.items())),
+                         extra={'reclaimed': dict(reclaimed)})
+
+
+class FlowControl:
+    """Keep any one player's backlog bounded.
+
+    A game may have at most max_events calls on a player waiting to be delivered or
+    acknowledged, and a player at most max_futures long-running calls on the game whose results
+    it hasn't collected. Beyond that, with overflow='wait', the caller waits until the player
+    catches up (or is evicted); with overflow='error', it gets a TooManyCalls.
+    """
+    OVERFLOW = ('wait', 'error')
+
+    def __init__(self, max_events=None, max_futures=None, overflow='wait'):
+        if overflow not in FlowControl.OVERFLOW:
+            raise ValueError("Unknown overflow policy {}".format(overflow))
+        self.limits = {'events': max_events, 'futures': max_futures}
+        self.overflow = overflow
+
+    async def admit(self, record, kind):
+        """Return once there's room for one more of kind ('events' or 'futures') on a player's record"""
+        limit = self.limits[kind]
+        if limit is None or record.backlog(kind) < limit:
+            return
+        if self.overflow == 'error':
+            metrics.FLOW_CONTROL.inc(kind, 'refused')
+            raise TooManyCalls("Too many {} pending for the player ({})".format(kind, limit))
+        metrics.FLOW_CONTROL.inc(kind, 'waited')
+        while record.backlog(kind) >= limit and not record.closed:
+            record.drained.clear()
+            await record.drained.wait()
@@ -0,0 +1,106 @@
+"""Clients and a Server in one event loop, talking without sockets.
+
+    srv = Server()
+    srv.register(Game)
+    async with remoter.loopback.Host(srv) as host:
+        game = await host.new_game(Game)
+        codes = await asyncio.gather(*(host.play(Client(Game, Bot, transport='sync'), game) for _ in range(2)))
+
+Each request a Client makes is routed by the Server's own router to its route handler, through
+its middleware, and the arguments and results are encoded and decoded by the codecs as usual:
+only HTTP and the network are left out. That makes for quick, deterministic tests of the whole
+remoting path, and a measure of the framework's overhead apart from the network's.
+The http and sync transports work over it; ws doesn't.
+"""
+import contextlib
+import functools
+import logging
+
+from aiohttp import web
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+import remoter.client
+
+log = logging.getLogger(__name__)
+
+
+class Request:
+    """As much of an aiohttp.web.Request as the Server's route handlers use"""
+    def __init__(self, method, url, headers=None, data=None):
+        self.method = method
+        self.rel_url = url.relative()
+        self.query = self.rel_url.query
+        self.headers = CIMultiDictProxy(CIMultiDict(headers or {}))
+        self.content_type = self.headers.get('Content-Type', 'application/octet-stream').partition(';')[0].strip()
+        self.match_info = None
+        self.data = data or b''
+
+    async def read(self):
+        return self.data
+
+
+class Response:
+    """As much of an aiohttp.ClientResponse as a Client uses"""
+    def __init__(self, status, reason, content_type, body):
+        self.status = status
+        self.reason = reason
+        self.content_type = content_type
+        self.body = body
+
+    async def read(self):
+        return self.body
+
+
+class Session:
+    """Stands in for the aiohttp.ClientSession of a Client, handing its requests straight to an aiohttp app"""
+    def __init__(self, app):
+        self.app = app
+        self.closed = False
+
+    @contextlib.asynccontextmanager
+    async def request(self, method, url, data=None, headers=None, params=None):
+        url = URL(url)
+        if params:
+            url = url.update_query(params)
+        yield await self.handle(Request(method, url, headers, data))
+
+    async def handle(self, request):
+        request.match_info = match = await self.app.router.resolve(request)
+        handler = match.handler
+        for middleware in reversed(self.app.middlewares):
+            handler = functools.partial(middleware, handler=handler)
+        try:
+            response = await handler(request)
+        except web.HTTPException as ex:
+            return Response(ex.status, ex.reason, 'text/plain', (ex.text or '').encode())
+        except Exception:
+            log.exception("error handling %s %s", request.method, request.rel_url)
+            return Response(500, 'Internal Server Error', 'text/plain', b'500 Internal Server Error')
+        return Response(response.status, response.reason, response.content_type, response.body)
+
+    def ws_connect(self, *args, **kwargs):
+        raise RuntimeError("websockets can't be used over the loopback: use the http or sync transport")
+
+    async def close(self):
+        self.closed = True
+
+
+class Host(remoter.client.Host):
+    """A Host whose players play on a Server in the same event loop, over a loopback Session.
+
+    The server is started (its sweeps and snapshots begin) on entering the block, and stopped on leaving it.
+    """
+    def __init__(self, server):
+        super().__init__('loopback', 0)
+        self.server = server
+
+    async def __aenter__(self):
+        await self.server.start(self.server.app)
+        self.session = Session(self.server.app)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+        await self.server.stop(self.server.app)
@@ -0,0 +1,127 @@
+from collections import namedtuple
+import inspect
+
+
+# A description of one remotable method: whether callers wait for it (_await),
+# the names of its positional parameters, which arguments must be supplied,
+# which may be passed by name, and (for player methods) whether the caller
+# needs to hear back when it has run (_ack).
+Method = namedtuple('Method', ['name', 'awaits', 'params', 'required', 'keywords', 'varargs', 'varkw', 'acks'],
+                    defaults=(True,))
+
+# cls -> {name: Method}
+_tables = {}
+
+
+def describe(name, fn):
+    try:
+        sig = inspect.signature(fn)
+    except (TypeError, ValueError):
+        return Method(name, True, (), (), (), True, True, True)
+
+    params = list(sig.parameters.values())
+    if params and params[0].name == 'self' and inspect.isfunction(fn):
+        # Looked up on the class, so not yet bound
+        params = params[1:]
+
+    awaits = True
+    acks = True
+    positional = []
+    required = []
+    keywords = []
+    varargs = varkw = False
+    for p in params:
+        if p.name == '_await':
+            # By default, we 'synchronously' call the server
+            awaits = p.default if p.default is not p.empty else True
+            continue
+        if p.name == '_ack':
+            # A player method with _ack=False is one-way: the game doesn't wait for it
+            acks = p.default if p.default is not p.empty else True
+            continue
+        if p.kind == p.VAR_POSITIONAL:
+            varargs = True
+            continue
+        if p.kind == p.VAR_KEYWORD:
+            varkw = True
+            continue
+        if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD):
+            positional.append(p.name)
+        if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY):
+            keywords.append(p.name)
+        if p.default is p.empty:
+            required.append(p.name)
+    return Method(name, awaits, tuple(positional), tuple(required), tuple(keywords), varargs, varkw, acks)
+
+
+def method_table(cls):
+    """Return {name: Method} for the public remotable methods of cls, computed once per class"""
+    try:
+        return _tables[cls]
+    except KeyError:
+        pass
+    table = _tables[cls] = {name: describe(name, fn)
+                            for name, fn in inspect.getmembers(cls, remotable)
+                            if not name.startswith('_')}
+    return table
+
+
+def remotable(fn):
+    # Coroutines, and plain methods marked to run in a pool (see remoter.offload)
+    return inspect.iscoroutinefunction(fn) or getattr(fn, '_offload', None) is not None
+
+
+def lookup(cls, name):
+    """Return the Method for cls.name, or None if there is no such callable"""
+    table = method_table(cls)
+    try:
+        return table[name]
+    except KeyError:
+        pass
+    # Not a plain coroutine method: describe whatever the attribute is, and remember it. Misses
+    # aren't remembered, or calls to made-up names would grow the table without end.
+    fn = getattr(cls, name, None)
+    if not callable(fn):
+        return None
+    table[name] = m = describe(name, fn)
+    return m
+
+
+def awaits(cls, name):
+    """Is cls.name marked as synchronous (_await=True, the default) or long-running?"""
+    m = lookup(cls, name)
+    return True if m is None else m.awaits
+
+
+def one_way(cls):
+    """The names of cls's methods marked _ack=False, which are called without waiting for them"""
+    return sorted(name for name, m in method_table(cls).items() if m is not None and not m.acks)
+
+
+def check(m, args, kwargs):
+    """Raise a TypeError if a call with these arguments could not bind to the method"""
+    if not m.varargs and len(args) > len(m.params):
+        raise TypeError("{}() takes {} positional arguments but {} were given".format(
+                        m.name, len(m.params), len(args)))
+    filled = set(m.params[:len(args)])
+    for k in kwargs:
+        if k in filled:
+            raise TypeError("{}() got multiple values for argument '{}'".format(m.name, k))
+        if k not in m.keywords and not m.varkw:
+            raise TypeError("{}() got an unexpected keyword argument '{}'".format(m.name, k))
+    missing = [n for n in m.required if n not in filled and n not in kwargs]
+    if missing:
+        raise TypeError("{}() missing required arguments: {}".format(m.name, ', '.join(missing)))
+
+
+def to_json(table):
+    return {name: {'await': m.awaits, 'params': list(m.params), 'required': list(m.required),
+                   'keywords': list(m.keywords), 'varargs': m.varargs, 'varkw': m.varkw, 'ack': m.acks}
+            for name, m in table.items()
+            if m is not None}
+
+
+def from_json(d):
+    return {name: Method(name, v['await'], tuple(v['params']), tuple(v['required']), tuple(v['keywords']),
+                         v['varargs'], v['varkw'], v.get('ack', True))
+            for name, v in d.items()}
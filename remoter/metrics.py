@@ -0,0 +1,172 @@
+import bisect
+from collections import OrderedDict
+import re
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Metric:
+    """A family of samples distinguished by label values, in the Prometheus text format"""
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        # label values -> state
+        self.values = {}
+
+    def header(self):
+        return ['# HELP {} {}'.format(self.name, self.help),
+                '# TYPE {} {}'.format(self.name, self.kind)]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def lines(self):
+        return self.header() + [sample(self.name, self.labels, v, n) for v, n in sorted(self.values.items())]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value, *labels):
+        try:
+            counts, total = self.values[labels]
+        except KeyError:
+            counts, total = [0] * (len(self.buckets) + 1), 0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.values[labels] = (counts, total + value)
+
+    def lines(self):
+        out = self.header()
+        for v, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for le, n in zip(self.buckets + ('+Inf',), counts):
+                cumulative += n
+                out.append(sample(self.name + '_bucket', self.labels + ('le',), v + (str(le),), cumulative))
+            out.append(sample(self.name + '_sum', self.labels, v, total))
+            out.append(sample(self.name + '_count', self.labels, v, cumulative))
+        return out
+
+
+class Gauges(Metric):
+    """Gauges whose values are read off live state, by a function returning {label values: value}, when scraped"""
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels, collect, kind='gauge'):
+        super().__init__(name, help, labels)
+        self.collect = collect
+        self.kind = kind
+
+    def lines(self):
+        return self.header() + [sample(self.name, self.labels, v, n) for v, n in sorted(self.collect().items())]
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def sample(name, labels, values, value):
+    if labels:
+        name += '{' + ','.join('{}="{}"'.format(k, escape(v)) for k, v in zip(labels, values)) + '}'
+    return '{} {}'.format(name, value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def remove(self, metric):
+        self.metrics.remove(metric)
+
+    def exposition(self):
+        return '\n'.join(line for m in self.metrics for line in m.lines()) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.add(Counter('remoter_requests_total', 'HTTP requests handled',
+                                ('method', 'route', 'status')))
+REQUEST_SECONDS = REGISTRY.add(Histogram('remoter_request_seconds', 'Time to handle an HTTP request',
+                                         ('method', 'route')))
+CALLS = REGISTRY.add(Counter('remoter_calls_total', 'Remoted game method calls',
+                             ('cls', 'method', 'outcome')))
+CALL_SECONDS = REGISTRY.add(Histogram('remoter_call_seconds', 'Time for a remoted game method to complete',
+                                      ('cls', 'method')))
+PLAYER_CALL_SECONDS = REGISTRY.add(Histogram('remoter_player_call_seconds',
+                                             'Time from a call on a player to its acknowledgement by the client',
+                                             ('method',)))
+FLOW_CONTROL = REGISTRY.add(Counter('remoter_flow_control_total',
+                                    "Calls held back or refused because a player's backlog was full",
+                                    ('kind', 'action')))
+
+
+def max_rss():
+    # ru_maxrss is in kilobytes, except on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {(): rss if sys.platform == 'darwin' else rss * 1024}
+
+
+PROCESS_CPU_SECONDS = REGISTRY.add(Gauges('process_cpu_seconds_total', 'User and system CPU time spent', (),
+                                          lambda: {(): time.process_time()}, kind='counter'))
+if resource is not None:
+    PROCESS_MAX_RSS = REGISTRY.add(Gauges('process_max_resident_memory_bytes', 'Peak resident memory', (), max_rss))
+
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? (.*)$')
+
+
+def merge(expositions, label):
+    """Combine the exposition text of several servers, telling their samples apart with label=<index>"""
+    families = OrderedDict()
+    for n, text in enumerate(expositions):
+        family = None
+        for line in text.splitlines():
+            if line.startswith('# '):
+                _, _, name, _ = (line + ' ').split(' ', 3)
+                family = families.setdefault(name, ([], []))
+                if line not in family[0]:
+                    family[0].append(line)
+                continue
+            m = SAMPLE.match(line)
+            if m is None or family is None:
+                continue
+            name, labels, value = m.groups()
+            labels = '{}="{}"'.format(label, n) + (',' + labels[1:-1] if labels else '')
+            family[1].append('{}{{{}}} {}'.format(name, labels, value))
+    return ''.join('\n'.join(headers + samples) + '\n' for headers, samples in families.values())
+
+
+def parse(text):
+    """Read exposition text back into {(name, labels): value}, labels being a sorted tuple of (label, value)"""
+    samples = {}
+    for line in text.splitlines():
+        m = SAMPLE.match(line)
+        if m is None or line.startswith('#'):
+            continue
+        name, labels, value = m.groups()
+        pairs = re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', labels or '')
+        samples[name, tuple(sorted(pairs))] = float(value)
+    return samples
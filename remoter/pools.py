@@ -0,0 +1,30 @@
+"""The pools that game methods marked with remoter.offload run in, off the event loop"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import functools
+
+
+class Pools:
+    """A thread pool of up to threads threads (None for Python's default), and a process pool of
+    processes processes. With no process pool, methods marked for one run in the thread pool.
+
+    A call whose deadline passes is abandoned, but the thread or process it was running in carries
+    on with it to the end.
+    """
+    def __init__(self, threads=None, processes=0):
+        self.threads = ThreadPoolExecutor(threads, thread_name_prefix='remoter')
+        self.processes = ProcessPoolExecutor(processes) if processes else None
+
+    def executor(self, pool):
+        if pool == 'process' and self.processes is not None:
+            return self.processes
+        return self.threads
+
+    async def run(self, fn, args, kwargs):
+        pool = self.executor(fn._offload)
+        return await asyncio.get_running_loop().run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self):
+        self.threads.shutdown(wait=False)
+        if self.processes is not None:
+            self.processes.shutdown(wait=False)
@@ -1,62 +1,182 @@
-from collections import namedtuple
-from json.decoder import JSONDecodeError
+from collections import Counter, namedtuple
+import logging
+import pickle
 import random
+import time
 from aiohttp import web
 import asyncio
 
+from remoter import DeadlineExceeded, codec, hooks, metrics, within
+from remoter.lifecycle import FlowControl, Lifecycle, NotFound, TooManyCalls, TooManyGames
+from remoter.pools import Pools
+from remoter.methods import method_table, to_json
+from remoter.snapshot import Snapshots
+
+log = logging.getLogger(__name__)
+
 
 class Handler:
-    def __init__(self, cls):
+    def __init__(self, cls, shard=0, shards=1, flow=None, pools=None):
         self.cls = cls
+        self.flow = flow or FlowControl()
+        self.pools = pools or Pools()
+        self.name = cls.__module__ + '.' + cls.__name__
         self.instances = {}
+        self.shard = shard
+        self.shards = shards
+        if getattr(cls, 'on_deadline', 'raise') not in EventHandler.ON_DEADLINE:
+            raise ValueError("Unknown on_deadline policy {} for {}".format(cls.on_deadline, self.name))
+
+    def attach(self, eh):
+        """Apply the server's flow control, and the class's deadlines for calls on players, to an instance"""
+        eh.flow = self.flow
+        eh.deadline = getattr(self.cls, 'deadline', None)
+        eh.on_deadline = getattr(self.cls, 'on_deadline', 'raise')
+        eh.retries = getattr(self.cls, 'deadline_retries', 1)
+        return eh
 
     def new(self):
-        eh = EventHandler()
+        eh = self.attach(EventHandler())
         i = self.cls()
-        self.instances[id(i)] = (i, eh)
-        return id(i)
-
-    async def invoke(self, instance, method, args):
-        m = getattr(self.instances[instance][0], method)
+        # A fresh random id for every game, never one an evicted game had, so that a stale or
+        # reconnecting client gets a 404 rather than a stranger's game. Ids carry the shard that
+        # owns them (see remoter.shard), and stay within the integers a JSON client can hold.
+        while True:
+            n = random.getrandbits(48) * self.shards + self.shard
+            if n not in self.instances:
+                break
+        self.instances[n] = (i, eh)
+        return n
+
+    def get(self, instance):
+        """Look up an instance, noting that it is still in use"""
+        try:
+            i, eh = self.instances[instance]
+        except KeyError:
+            raise NotFound("No game {}: it has finished, or been evicted".format(instance)) from None
+        eh.last_active = time.monotonic()
+        return i, eh
+
+    def evict(self, instance):
+        """Drop an instance, cancelling anything still running on its behalf.
+
+        Returns a Counter of what was reclaimed.
+        """
+        eh = self.instances.pop(instance)[1]
+        return eh.close()
+
+    def snapshot(self):
+        """Pickle each instance along with its players' state; skip any that can't be"""
+        states = {}
+        for n, (i, eh) in self.instances.items():
+            try:
+                states[n] = pickle.dumps((i, eh))
+            except Exception as ex:
+                log.warning("cannot snapshot %s instance %d: %s", self.name, n, ex)
+        return states
+
+    def restore(self, states):
+        """Reinstate pickled instances, and let each resume its work if it knows how"""
+        restored = 0
+        for n, state in states.items():
+            try:
+                i, eh = pickle.loads(state)
+            except Exception as ex:
+                log.warning("cannot restore %s instance %d: %s", self.name, n, ex)
+                continue
+            if n in self.instances:
+                log.warning("not restoring %s instance %d: the id is taken", self.name, n)
+                continue
+            self.attach(eh)
+            self.instances[n] = (i, eh)
+            restored += 1
+            resume = getattr(i, 'resume', None)
+            if callable(resume):
+                eh.track(asyncio.create_task(resume()))
+        return restored
+
+    async def invoke(self, instance, method, args, deadline=None):
+        m = getattr(self.get(instance)[0], method)
         try:
             pos = args.pop('')
         except KeyError:
             pos = ()
         if callable(m):
-            return await m(*pos, **args)
+            return await self.measure(method, pos, args, within(self.call(m, pos, args), deadline, method))
 
-    async def invoke_async(self, instance, pid, method, args):
-        m = getattr(self.instances[instance][0], method)
+    async def invoke_batch(self, instance, calls):
+        """Make several calls, one after another, stopping at the first to fail"""
+        self.get(instance)
+        results = []
+        for method, args in calls:
+            try:
+                results.append(await self.invoke(instance, method, args))
+            except Exception as ex:
+                return {'results': results, 'error': str(ex)}
+        return {'results': results}
+
+    async def invoke_async(self, instance, pid, method, args, deadline=None):
+        i, eh = self.get(instance)
+        m = getattr(i, method)
         try:
             pos = args.pop('')
         except KeyError:
             pos = ()
 
         if callable(m):
-            return self.instances[instance][1].invoke_async(pid, m(*pos, **args))
-
-    def new_player(self, instance):
-        i, eh = self.instances[instance]
-        player, pid = eh.new_player()
+            await eh.admit(pid, 'futures')
+            return eh.invoke_async(pid, self.measure(method, pos, args,
+                                                     within(self.call(m, pos, args), deadline, method)))
+
+    def call(self, m, args, kwargs):
+        """Something to await for the result of a method: in a pool, if it is marked with remoter.offload"""
+        if getattr(m, '_offload', None) is not None:
+            return self.pools.run(m, args, kwargs)
+        return m(*args, **kwargs)
+
+    async def measure(self, method, args, kwargs, coro):
+        started = time.monotonic()
+        call = hooks.start('server', 'game', method, args, kwargs)
+        outcome = 'error'
+        try:
+            result = await coro
+            outcome = 'ok'
+            return result
+        except asyncio.CancelledError:
+            outcome = 'cancelled'
+            raise
+        except DeadlineExceeded:
+            outcome = 'timeout'
+            raise
+        finally:
+            metrics.CALLS.inc(self.name, method, outcome)
+            metrics.CALL_SECONDS.observe(time.monotonic() - started, self.name, method)
+            hooks.finish(call, outcome)
+
+    def new_player(self, instance, one_way=()):
+        i, eh = self.get(instance)
+        player, pid = eh.new_player(one_way)
         try:
-            print("about to launch coroutine")
-            asyncio.create_task(i.new_player(player))
-            print("launched coroutine")
+            eh.track(asyncio.create_task(i.new_player(player)))
+            log.debug("launched new_player", extra={'instance': instance, 'pid': pid})
         except Exception:
-            pass
+            log.exception("cannot launch new_player for %s instance %d", self.name, instance)
         return pid
 
-    def player_events(self, instance, pid):
-        return self.instances[instance][1].player_events(pid)
+    def player_events(self, instance, pid, since=0):
+        return self.get(instance)[1].player_events(pid, since)
+
+    async def wait_player(self, instance, pid, timeout, since=None, futures=True):
+        await self.get(instance)[1].wait_player(pid, timeout, since, futures)
 
     def ack_event(self, instance, pid, event, result):
-        self.instances[instance][1].ack_event(pid, event, result)
+        self.get(instance)[1].ack_event(pid, event, result)
 
     def player_futures(self, instance, pid):
-        return self.instances[instance][1].player_futures(pid)
+        return self.get(instance)[1].player_futures(pid)
 
     def ack_future(self, instance, pid, event):
-        self.instances[instance][1].ack_future(pid, event)
+        self.get(instance)[1].ack_future(pid, event)
 
 
 class PlayerProxy:
@@ -67,141 +187,548 @@ class PlayerProxy:
     def __getattr__(self, call):
         # p.foo(a, b, c)  -> send an asynchronous foo(a, b, c)
 
-        async def c(*args, **kwargs):
-            # When called, register an event to the player
-            future = asyncio.Future()
-            n = self.__eh.post_event(self.__pid, call, args, kwargs, future)
-            print("{} returned event {}".format(call, n))
-            return await future
+        async def c(*args, _deadline=None, **kwargs):
+            eh, pid = self.__eh, self.__pid
+            # When called, register an event to the player, once it has room for one
+            await eh.admit(pid, 'events')
+            h = hooks.start('server', 'player', call, args, kwargs)
+            if eh.one_way(pid, call):
+                # Queued behind any earlier events, but nothing waits for it to run
+                n = eh.post_event(pid, call, args, kwargs, None)
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("%s posted as one-way event %d", call, n, extra={'pid': pid, 'event': n})
+                hooks.finish(h, 'ok')
+                return None
+
+            deadline = eh.deadline if _deadline is None else _deadline
+            tries = 1 + (eh.retries if eh.on_deadline == 'retry' else 0)
+            started = time.monotonic()
+            outcome = 'error'
+            try:
+                for attempt in range(tries):
+                    future = asyncio.Future()
+                    # The player is told the deadline too, and gives up at the same time
+                    n = eh.post_event(pid, call, args, kwargs, future, deadline)
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("%s posted as event %d", call, n, extra={'pid': pid, 'event': n})
+                    try:
+                        result = await within(future, deadline, call)
+                        outcome = 'ok'
+                        return result
+                    except DeadlineExceeded:
+                        # Take the call back: the player's acknowledgement, if it comes, is ignored
+                        eh.withdraw(pid, n)
+                        log.info("player missed the %.3gs deadline for %s", deadline, call,
+                                 extra={'pid': pid, 'event': n, 'attempt': attempt + 1})
+                outcome = 'timeout'
+                if eh.on_deadline == 'forfeit':
+                    eh.evict_player(pid)
+                raise DeadlineExceeded("player {} didn't answer {} within {}s".format(pid, call, deadline))
+            except asyncio.CancelledError:
+                outcome = 'cancelled'
+                raise
+            finally:
+                metrics.PLAYER_CALL_SECONDS.observe(time.monotonic() - started, call)
+                hooks.finish(h, outcome)
         return c
 
+    # Players are pickled as part of their game: see Handler.snapshot
+    def __getstate__(self):
+        return self.__dict__.copy()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
 
 class EventHandler:
-    def __init__(self):
+    # What to do when a player misses a deadline: raise DeadlineExceeded in the game; evict the
+    # player, then raise; or send the call again (deadline_retries times), then raise
+    ON_DEADLINE = ('raise', 'forfeit', 'retry')
+
+    def __init__(self, flow=None):
+        # See Handler.attach
+        self.flow = flow or FlowControl()
+        self.deadline = None
+        self.on_deadline = 'raise'
+        self.retries = 1
         self.events = {}
         self.futures = {}
+        self.last_active = time.monotonic()
+        # Coroutines running on behalf of this instance
+        self.tasks = set()
+
+    def __getstate__(self):
+        return {'events': self.events}
 
-    def new_player(self):
+    def __setstate__(self, state):
+        self.__init__()
+        self.events = state['events']
+
+    def track(self, task):
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def finished(self):
+        """Have all the players been told to exit?"""
+        return len(self.events) > 0 and all(r.exited for r in self.events.values())
+
+    def evict_player(self, pid):
+        return self.events.pop(pid).close()
+
+    def close(self):
+        reclaimed = Counter(games=1)
+        for pid in list(self.events):
+            reclaimed += self.evict_player(pid)
+        for t in list(self.tasks):
+            t.cancel()
+        return reclaimed
+
+    def new_player(self, one_way=()):
         for i in range(1000):
             pid = random.randrange(8999) + 1000
             if pid not in self.events:
-                self.events[pid] = EHRecord()
+                self.events[pid] = EHRecord(one_way)
                 return PlayerProxy(pid, self), pid
         raise KeyError()
 
-    def player_events(self, pid):
-        return {n: (e.call, e.args, e.kwargs)
-                for n, e in self.events[pid].events.items()}
+    def record(self, pid):
+        try:
+            return self.events[pid]
+        except KeyError:
+            raise NotFound("No player {}: it has left, or been evicted".format(pid)) from None
+
+    def player_events(self, pid, since=0):
+        return self.record(pid).take_events(since)
 
-    def post_event(self, pid, call, args, kwargs, future):
-        return self.events[pid].post_event(call, args, kwargs, future)
+    async def admit(self, pid, kind):
+        await self.flow.admit(self.record(pid), kind)
+        if pid not in self.events:
+            raise NotFound("No player {}: it was evicted while waiting".format(pid))
+
+    async def wait_player(self, pid, timeout, since=None, futures=True):
+        await self.record(pid).wait(timeout, since, futures)
+
+    def one_way(self, pid, call):
+        return call in self.events[pid].one_way
+
+    def post_event(self, pid, call, args, kwargs, future, deadline=None):
+        return self.events[pid].post_event(call, args, kwargs, future, deadline)
+
+    def withdraw(self, pid, n):
+        r = self.events.get(pid)
+        if r is not None:
+            r.withdraw(n)
 
     def ack_event(self, pid, n, result):
-        self.events[pid].ack_event(n, result)
+        self.record(pid).ack_event(n, result)
 
     def player_futures(self, pid):
-        return self.events[pid].futures
+        return self.record(pid).futures
 
     def invoke_async(self, pid, future):
-        return self.events[pid].post_future(future)
+        return self.events[pid].post_future(future, self.track)
 
     def ack_future(self, pid, n):
-        self.events[pid].ack_future(n)
+        self.record(pid).ack_future(n)
 
 
-Event = namedtuple('Event', ['call', 'args', 'kwargs', 'cb'])
+# expires is when the player should give up on it, by the monotonic clock, if ever
+Event = namedtuple('Event', ['call', 'args', 'kwargs', 'cb', 'expires'], defaults=(None,))
 
 
 class EHRecord:
-    def __init__(self):
+    def __init__(self, one_way=()):
+        # Calls the player doesn't acknowledge: see PlayerProxy
+        self.one_way = frozenset(one_way)
         self.last_event = 0
         self.events = {}
         self.last_future = 0
         self.futures = {}
-
-    def post_event(self, call, args, kwargs, future):
+        # Long-running calls whose results aren't in futures yet
+        self.running = 0
+
+        # The highest event number handed out to the player so far
+        self.delivered = 0
+        # Set whenever a new event or future result is available
+        self.changed = asyncio.Event()
+        # Set whenever the backlog shrinks, for FlowControl
+        self.drained = asyncio.Event()
+        self.closed = False
+
+        # When the player last asked for anything, and when each future result arrived
+        self.last_active = time.monotonic()
+        self.future_times = {}
+        # Has the player been sent an exit?
+        self.exited = False
+        # Restored events with nothing yet waiting on them
+        self.orphans = 0
+
+    def __getstate__(self):
+        return {'last_event': self.last_event, 'delivered': self.delivered, 'exited': self.exited,
+                'one_way': sorted(self.one_way),
+                'events': {n: (e.call, e.args, e.kwargs) for n, e in self.events.items()},
+                'last_future': self.last_future, 'futures': self.futures}
+
+    def __setstate__(self, state):
+        self.__init__(state.get('one_way', ()))
+        self.last_event = state['last_event']
+        self.delivered = state['delivered']
+        self.exited = state['exited']
+        self.events = {n: Event(call, args, kwargs, None) for n, (call, args, kwargs) in state['events'].items()}
+        # One-way events are simply delivered again
+        self.orphans = sum(e.call not in self.one_way for e in self.events.values())
+        self.last_future = state['last_future']
+        self.futures = state['futures']
+        self.future_times = {n: self.last_active for n in self.futures}
+
+    def post_event(self, call, args, kwargs, future, deadline=None):
+        expires = None if deadline is None else time.monotonic() + deadline
+        if self.orphans:
+            # A resumed game making the same call again takes over the restored event,
+            # so the player sees it (and acknowledges it) only once.
+            for n, e in self.events.items():
+                if e.cb is None and e.call not in self.one_way and (e.call, e.args, e.kwargs) == (call, args, kwargs):
+                    self.events[n] = e._replace(cb=future, expires=expires)
+                    self.orphans -= 1
+                    return n
         self.last_event += 1
-        self.events[self.last_event] = Event(call, args, kwargs, future)
+        self.events[self.last_event] = Event(call, args, kwargs, future, expires)
+        if call == 'exit':
+            self.exited = True
+        self.changed.set()
         return self.last_event
 
-    def ack_event(self, n, result):
-        cb = self.events[n].cb
-        cb.set_result(result)
-        del self.events[n]
+    def take_events(self, since=0):
+        self.last_active = time.monotonic()
+        self.delivered = self.last_event
+        # The player has seen the one-way events up to its cursor, and won't acknowledge them
+        if self.one_way and since:
+            for n in [n for n, e in self.events.items() if n <= since and e.call in self.one_way]:
+                del self.events[n]
+                self.drained.set()
+        now = time.monotonic()
+        # Events with a deadline carry the seconds left to run them in
+        return {n: (e.call, e.args, e.kwargs) if e.expires is None else
+                   (e.call, e.args, e.kwargs, max(0, e.expires - now))
+                for n, e in self.events.items()
+                if n > since}
+
+    def pending(self, since=None, futures=True):
+        """Is there anything the player hasn't seen (or, with futures, any result it hasn't collected)?
+
+        Without a cursor from the player, assume it has seen everything handed out so far. Events
+        since acknowledged or withdrawn don't count: a player reconnecting from cursor 0 may have
+        seen every event that remains.
+        """
+        if since is None:
+            since = self.delivered
+        return any(n > since for n in self.events) or (futures and len(self.futures) > 0)
+
+    async def wait(self, timeout, since=None, futures=True):
+        """Park until there is something new for the player, or the timeout expires"""
+        self.last_active = time.monotonic()
+        if self.pending(since, futures):
+            return
+        self.changed.clear()
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
 
-    def post_future(self, future):
+    def ack_event(self, n, result):
+        self.last_active = time.monotonic()
+        try:
+            e = self.events.pop(n)
+        except KeyError:
+            # Already acknowledged, or dropped along with an evicted player
+            return
+        self.drained.set()
+        cb = e.cb
+        if cb is None:
+            if e.call not in self.one_way:
+                self.orphans -= 1
+        elif not cb.done():
+            cb.set_result(result)
+
+    def backlog(self, kind):
+        if kind == 'events':
+            return len(self.events)
+        return len(self.futures) + self.running
+
+    def withdraw(self, n):
+        """Drop an event whose caller has given up on it"""
+        if self.events.pop(n, None) is not None:
+            self.drained.set()
+
+    def post_future(self, future, track):
         self.last_future += 1
-        asyncio.create_task(self.wrap_future(self.last_future, future))
+        self.running += 1
+        track(asyncio.create_task(self.wrap_future(self.last_future, future)))
         return self.last_future
 
     async def wrap_future(self, n, future):
-        self.futures[n] = await future
+        try:
+            self.futures[n] = await future
+        except DeadlineExceeded as ex:
+            # The player has given up on it too
+            log.info("%s", ex)
+            return
+        finally:
+            self.running -= 1
+        self.future_times[n] = time.monotonic()
+        self.changed.set()
 
     def ack_future(self, n):
-        del self.futures[n]
+        self.last_active = time.monotonic()
+        try:
+            del self.futures[n]
+        except KeyError:
+            # Already collected, or expired by the lifecycle sweep
+            return
+        del self.future_times[n]
+        self.drained.set()
+
+    def expire_futures(self, before):
+        """Forget future results that arrived before a given time without being collected"""
+        stale = [n for n, t in self.future_times.items() if t < before]
+        for n in stale:
+            del self.futures[n]
+            del self.future_times[n]
+        if stale:
+            self.drained.set()
+        return len(stale)
+
+    def close(self):
+        # Anything in the game still waiting on this player gets cancelled
+        for e in self.events.values():
+            if e.cb is not None:
+                e.cb.cancel()
+        reclaimed = Counter(players=1, events=len(self.events), futures=len(self.futures))
+        self.events = {}
+        self.futures = {}
+        self.future_times = {}
+        # Wake anything waiting for room
+        self.closed = True
+        self.drained.set()
+        return reclaimed
 
 
 class Server:
-    def __init__(self):
+    def __init__(self, max_wait=30, websocket=True, shard=0, shards=1,
+                 idle_ttl=3600, finished_ttl=60, max_games=None,
+                 snapshot=None, snapshot_interval=10,
+                 max_events=None, max_futures=None, overflow='wait', threads=None, processes=0):
         self.handlers = {}
-        app = self.app = web.Application()
-        app.add_routes([web.post('/{cls}', self.new),
+        self.shard = shard
+        self.shards = shards
+        # Upper bound on how long a long-poll request may be parked
+        self.max_wait = max_wait
+        self.lifecycle = Lifecycle(idle_ttl=idle_ttl, finished_ttl=finished_ttl, max_games=max_games)
+        self.flow = FlowControl(max_events=max_events, max_futures=max_futures, overflow=overflow)
+        self.pools = Pools(threads=threads, processes=processes)
+        self.snapshots = Snapshots(snapshot, snapshot_interval) if snapshot is not None else None
+        app = self.app = web.Application(middlewares=[self.measure, self.not_found])
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        if websocket:
+            app.add_routes([web.get('/{cls}/{instance}/player/{pid}/ws', self.player_socket)])
+        app.add_routes([web.get('/metrics', self.scrape),
+                        web.post('/{cls}', self.new),
+                        web.get('/{cls}/methods', self.methods),
                         web.post('/{cls}/{instance}/player', self.new_player),
                         web.get('/{cls}/{instance}/player/{pid}/e', self.player_events),
                         web.post('/{cls}/{instance}/player/{pid}/e/{event}', self.ack_player_event),
                         web.get('/{cls}/{instance}/player/{pid}/f', self.player_futures),
                         web.delete('/{cls}/{instance}/player/{pid}/f/{future}', self.ack_player_future),
+                        web.post('/{cls}/{instance}/player/{pid}/sync', self.player_sync),
+                        web.post('/{cls}/{instance}/batch', self.invoke_batch),
                         web.post('/{cls}/{instance}/{method}', self.invoke),
                         ])
 
-    def run(self, host=None, port=None, debug=False):
-        web.run_app(self.app, host=host, port=port)
+    def run(self, host=None, port=None, debug=False, path=None):
+        web.run_app(self.app, host=host, port=port, path=path)
+
+    async def start(self, app):
+        self.tasks = [asyncio.create_task(self.lifecycle.run(self.handlers.values()))]
+        if self.snapshots is not None:
+            log.info("restored %d games from %s", self.snapshots.restore(self.handlers), self.snapshots.path)
+            self.tasks.append(asyncio.create_task(self.snapshots.run(self.handlers)))
+
+    async def stop(self, app):
+        for t in self.tasks:
+            t.cancel()
+        if self.snapshots is not None:
+            log.info("saved %d games to %s", self.snapshots.save(self.handlers), self.snapshots.path)
+        self.pools.shutdown()
+
+    @web.middleware
+    async def measure(self, request, handler):
+        started = time.monotonic()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as ex:
+            status = ex.status
+            raise
+        finally:
+            resource = request.match_info.route.resource
+            route = resource.canonical if resource is not None else 'unmatched'
+            metrics.REQUESTS.inc(request.method, route, str(status))
+            metrics.REQUEST_SECONDS.observe(time.monotonic() - started, request.method, route)
+
+    @web.middleware
+    async def not_found(self, request, handler):
+        # Games and players come and go (see Lifecycle): one that's gone is a 404, not a server error
+        try:
+            return await handler(request)
+        except NotFound as ex:
+            raise web.HTTPNotFound(text=str(ex.args[0]))
+
+    def gauges(self):
+        """Metrics read off the live state of the server"""
+        def records():
+            for name, h in self.handlers.items():
+                for instance, (i, eh) in h.instances.items():
+                    for pid, r in eh.events.items():
+                        yield (name, str(instance), str(pid)), r
+
+        return [metrics.Gauges('remoter_instances', 'Live game instances', ('cls',),
+                               lambda: {(name,): len(h.instances) for name, h in self.handlers.items()}),
+                metrics.Gauges('remoter_players', 'Players of live game instances', ('cls',),
+                               lambda: {(name,): sum(len(eh.events) for i, eh in h.instances.values())
+                                        for name, h in self.handlers.items()}),
+                metrics.Gauges('remoter_pending_events', 'Calls on a player not yet acknowledged',
+                               ('cls', 'instance', 'pid'), lambda: {k: len(r.events) for k, r in records()}),
+                metrics.Gauges('remoter_pending_futures', 'Results of long-running calls not yet collected',
+                               ('cls', 'instance', 'pid'), lambda: {k: len(r.futures) for k, r in records()}),
+                metrics.Gauges('remoter_reclaimed', 'Resources reclaimed by eviction since startup', ('kind',),
+                               lambda: {(k,): n for k, n in self.lifecycle.reclaimed.items()}),
+                ]
+
+    # GET /metrics
+    async def scrape(self, request):
+        text = metrics.REGISTRY.exposition() + ''.join('\n'.join(g.lines()) + '\n' for g in self.gauges())
+        return web.Response(body=text.encode(), headers={'Content-Type': metrics.CONTENT_TYPE})
 
     def register(self, cls):
-        self.handlers[cls.__module__ + '.' + cls.__name__] = Handler(cls)
+        h = Handler(cls, self.shard, self.shards, self.flow, self.pools)
+        self.handlers[h.name] = h
 
     # POST /<cls>
     async def new(self, request):
         cls = request.match_info['cls']
-        return web.json_response(self.handlers[cls].new())
+        try:
+            self.lifecycle.admit(self.handlers.values())
+        except TooManyGames as ex:
+            raise web.HTTPServiceUnavailable(text=str(ex))
+        return self.respond(request, self.handlers[cls].new())
+
+    # Request bodies are decoded according to their Content-Type. Responses use
+    # the codec named in the Accept header, or else that of the request.
+    async def body(self, request, default=None):
+        data = await request.read()
+        if not data:
+            return default
+        try:
+            return codec.for_content_type(request.content_type, codec.JSON).loads(data)
+        except ValueError:
+            return default
+
+    def respond(self, request, obj=None):
+        accepted = codec.for_content_type(request.headers.get('Accept'))
+        c = accepted or codec.for_content_type(request.content_type, codec.JSON)
+        return web.Response(body=c.dumps(obj), content_type=c.content_type)
+
+    # GET /<cls>/methods
+    #
+    # {"<method>": {"await": true, "params": [...], "required": [...], "keywords": [...],
+    #               "varargs": false, "varkw": false, "ack": true}, ...}
+    async def methods(self, request):
+        cls = request.match_info['cls']
+        return self.respond(request, to_json(method_table(self.handlers[cls].cls)))
 
     REMOTER_HEADER = 'X-Remoter-Async'
+    DEADLINE_HEADER = 'X-Remoter-Deadline'
+
+    def deadline(self, request):
+        try:
+            return float(request.headers[Server.DEADLINE_HEADER])
+        except (KeyError, ValueError):
+            return None
 
     # POST /<cls>/<instance>/<method> {"": [p1, p2, p3, ...], "arg1": "value1", ...}
     # POST /<cls>/<instance>/<method> X-Remoter-Async: <pid> {"": [p1, p2, p3, ...], "arg1": "value1", ...}
+    #
+    # With X-Remoter-Deadline: <seconds>, the method is cancelled if it runs for longer (a 504, or
+    # no result ever appearing among the player's futures).
     async def invoke(self, request):
         cls = request.match_info['cls']
         instance = int(request.match_info['instance'])
         method = request.match_info['method']
+        deadline = self.deadline(request)
 
         if Server.REMOTER_HEADER not in request.headers:
+            args = await self.body(request, {})
             try:
-                args = await request.json()
-            except JSONDecodeError:
-                args = {}
-            return web.json_response(await self.handlers[cls].invoke(instance, method, args))
+                return self.respond(request, await self.handlers[cls].invoke(instance, method, args, deadline))
+            except DeadlineExceeded as ex:
+                raise web.HTTPGatewayTimeout(text=str(ex))
         else:
             pid = int(request.headers[Server.REMOTER_HEADER])
+            args = await self.body(request, {})
             try:
-                args = await request.json()
-            except JSONDecodeError:
-                args = {}
-            return web.json_response(await self.handlers[cls].invoke_async(instance, pid, method, args))
+                return self.respond(request, await self.handlers[cls].invoke_async(instance, pid, method, args,
+                                                                                   deadline))
+            except TooManyCalls as ex:
+                raise web.HTTPTooManyRequests(text=str(ex))
+
+    # POST /<cls>/<instance>/batch [["<method>", {"": [p1, ...], "arg1": "value1", ...}], ...]
+    #   -> {"results": [r1, ...]} or, if a call fails, {"results": [results before it], "error": e}
+    async def invoke_batch(self, request):
+        cls = request.match_info['cls']
+        instance = int(request.match_info['instance'])
+        calls = await self.body(request, [])
+        return self.respond(request, await self.handlers[cls].invoke_batch(instance, calls))
 
-    # POST /<cls>/<instance>/player
+    # POST /<cls>/<instance>/player {"one_way": ["<method>", ...]}
+    #
+    # The player won't acknowledge calls to its one-way methods: they are dropped once
+    # delivered (that is, once a later cursor has passed them).
     async def new_player(self, request):
         cls = request.match_info['cls']
         instance = int(request.match_info['instance'])
+        body = await self.body(request) or {}
+
+        return self.respond(request, self.handlers[cls].new_player(instance, body.get('one_way', ())))
 
-        return web.json_response(self.handlers[cls].new_player(instance))
+    def wait_time(self, request):
+        try:
+            return max(0, min(float(request.query.get('wait', 0)), self.max_wait))
+        except ValueError:
+            return 0
 
-    # GET /<cls>/<instance>/player/<pid>/c
+    def cursor(self, request):
+        try:
+            return int(request.query['since'])
+        except (KeyError, ValueError):
+            return None
+
+    # GET /<cls>/<instance>/player/<pid>/e?wait=<seconds>&since=<event>
+    #
+    # {"<event>": [call, args, kwargs], ...}, with the seconds left to run it in appended to an
+    # event that has a deadline. Without a cursor, every unacknowledged event is returned.
     async def player_events(self, request):
         cls = request.match_info['cls']
         instance = int(request.match_info['instance'])
         pid = int(request.match_info['pid'])
+        since = self.cursor(request)
 
-        return web.json_response(self.handlers[cls].player_events(instance, pid))
+        wait = self.wait_time(request)
+        if wait > 0:
+            await self.handlers[cls].wait_player(instance, pid, wait, since)
+        return self.respond(request, self.handlers[cls].player_events(instance, pid, since or 0))
 
     # POST /<cls>/<instance>/player/<pid>/<event> result
     async def ack_player_event(self, request):
@@ -210,20 +737,20 @@ class Server:
         pid = int(request.match_info['pid'])
         event = int(request.match_info['event'])
 
-        try:
-            arg = await request.json()
-        except JSONDecodeError:
-            arg = None
+        arg = await self.body(request)
         self.handlers[cls].ack_event(instance, pid, event, arg)
-        return web.json_response()
+        return self.respond(request)
 
-    # GET /<cls>/<instance>/player/<pid>/f
+    # GET /<cls>/<instance>/player/<pid>/f?wait=<seconds>
     async def player_futures(self, request):
         cls = request.match_info['cls']
         instance = int(request.match_info['instance'])
         pid = int(request.match_info['pid'])
 
-        return web.json_response(self.handlers[cls].player_futures(instance, pid))
+        wait = self.wait_time(request)
+        if wait > 0:
+            await self.handlers[cls].wait_player(instance, pid, wait)
+        return self.respond(request, self.handlers[cls].player_futures(instance, pid))
 
     # POST /<cls>/<instance>/player/<pid>/f/<future>
     async def ack_player_future(self, request):
@@ -233,4 +760,100 @@ class Server:
         future = int(request.match_info['future'])
 
         self.handlers[cls].ack_future(instance, pid, future)
-        return web.json_response()
+        return self.respond(request)
+
+    # POST /<cls>/<instance>/player/<pid>/sync?wait=<seconds>&since=<event>
+    #   {"acks": {"<event>": result, ...}, "futures": [<future>, ...]}
+    #
+    # Acknowledge a batch of events and futures, then return everything pending:
+    #   {"events": {"<event>": [call, args, kwargs], ...}, "futures": {"<future>": result, ...}}
+    async def player_sync(self, request):
+        cls = request.match_info['cls']
+        instance = int(request.match_info['instance'])
+        pid = int(request.match_info['pid'])
+        handler = self.handlers[cls]
+
+        body = await self.body(request) or {}
+
+        for event, result in body.get('acks', {}).items():
+            handler.ack_event(instance, pid, int(event), result)
+        for future in body.get('futures', []):
+            handler.ack_future(instance, pid, int(future))
+
+        since = self.cursor(request)
+        wait = self.wait_time(request)
+        if wait > 0:
+            await handler.wait_player(instance, pid, wait, since)
+        return self.respond(request, {'events': handler.player_events(instance, pid, since or 0),
+                                      'futures': handler.player_futures(instance, pid)})
+
+    # GET /<cls>/<instance>/player/<pid>/ws
+    #
+    # A websocket carrying JSON messages in both directions:
+    #   -> {"op": "call", "id": n, "method": m, "args": {"": [p1, ...], "arg1": "value1", ...}, "deadline": s}
+    #   <- {"op": "return", "id": n, "result": r} or {"op": "return", "id": n, "error": e}
+    #   <- {"op": "event", "id": n, "call": c, "args": [...], "kwargs": {...}, "deadline": s}
+    #   -> {"op": "ack", "id": n, "result": r}
+    #   -> {"op": "batch", "id": n, "calls": [["<method>", {...}], ...]}, returned as for POST .../batch
+    async def player_socket(self, request):
+        cls = request.match_info['cls']
+        instance = int(request.match_info['instance'])
+        pid = int(request.match_info['pid'])
+        handler = self.handlers[cls]
+        # Turn the socket down (with a 404) if the game or player is gone
+        handler.get(instance)[1].record(pid)
+
+        ws = web.WebSocketResponse(protocols=[codec.protocol(c) for c in codec.CODECS.values()])
+        await ws.prepare(request)
+        c = codec.for_protocol(ws.ws_protocol, codec.JSON)
+
+        pusher = asyncio.create_task(self.push_events(ws, c, handler, instance, pid))
+        # Calls still running for this socket, which go with it when it closes
+        calls = set()
+        try:
+            async for msg in ws:
+                if msg.type not in (web.WSMsgType.TEXT, web.WSMsgType.BINARY):
+                    continue
+                m = c.loads(msg.data)
+                if m['op'] in ('call', 'batch'):
+                    task = asyncio.create_task(self.socket_call(ws, c, handler, instance, m))
+                    calls.add(task)
+                    task.add_done_callback(calls.discard)
+                elif m['op'] == 'ack':
+                    handler.ack_event(instance, pid, m['id'], m.get('result'))
+        finally:
+            pusher.cancel()
+            for task in calls:
+                task.cancel()
+        return ws
+
+    async def push_events(self, ws, c, handler, instance, pid):
+        # Anything still unacknowledged is (re)sent when a socket is first opened
+        since = 0
+        while not ws.closed:
+            events = handler.player_events(instance, pid, since)
+            for n, ev in sorted(events.items()):
+                msg = {'op': 'event', 'id': n, 'call': ev[0], 'args': ev[1], 'kwargs': ev[2]}
+                if len(ev) > 3:
+                    msg['deadline'] = ev[3]
+                await codec.send(ws, c, msg)
+                since = n
+            if not events:
+                # Never hog the event loop, even if the wait below were to return at once
+                await asyncio.sleep(0)
+            # Results of long-running calls come back over the socket, not as futures: don't wait on them
+            await handler.wait_player(instance, pid, self.max_wait, since, futures=False)
+
+    async def socket_call(self, ws, c, handler, instance, msg):
+        # Long-running (_await=False) methods need no special treatment here:
+        # the result is simply sent back whenever it is ready.
+        try:
+            if msg['op'] == 'batch':
+                result = await handler.invoke_batch(instance, msg['calls'])
+            else:
+                result = await handler.invoke(instance, msg['method'], msg.get('args') or {}, msg.get('deadline'))
+            reply = {'op': 'return', 'id': msg['id'], 'result': result}
+        except Exception as ex:
+            reply = {'op': 'return', 'id': msg['id'], 'error': str(ex)}
+        if not ws.closed:
+            await codec.send(ws, c, reply)
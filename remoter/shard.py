@@ -0,0 +1,239 @@
+import asyncio
+import bisect
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+
+import aiohttp
+from aiohttp import web
+
+from remoter import metrics
+import remoter.server
+
+log = logging.getLogger(__name__)
+
+# Request headers that describe the hop rather than the request
+HOP_HEADERS = {'host', 'connection', 'keep-alive', 'content-length', 'transfer-encoding', 'upgrade',
+               'sec-websocket-key', 'sec-websocket-version', 'sec-websocket-extensions', 'sec-websocket-protocol'}
+
+
+class HashRing:
+    """Consistent hashing of keys onto n nodes, each given replicas points on the ring"""
+    def __init__(self, n, replicas=64):
+        points = sorted((self.hash('{}-{}'.format(node, r)), node) for node in range(n) for r in range(replicas))
+        self.hashes = [h for h, _ in points]
+        self.nodes = [node for _, node in points]
+
+    @staticmethod
+    def hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def node(self, key):
+        return self.nodes[bisect.bisect(self.hashes, self.hash(key)) % len(self.nodes)]
+
+
+class Router:
+    """Front end for a set of backend servers, local or on other machines.
+
+    Each backend is started with its own shard number (its index in backends) and the number of
+    shards, which it encodes into the ids of the game instances it creates (see Handler.new).
+    Every request that names an instance so goes straight to the backend that owns it, over a
+    pool of kept-alive connections to each. New games are placed by one of PLACEMENTS:
+
+    round-robin: each backend in turn
+    load: on the backend with the fewest live games, as last read off their /metrics (every
+          refresh seconds) plus those placed since; backends that can't be reached are passed over
+    hash: by consistent hashing of the X-Remoter-Affinity request header, so that games with the
+          same key share a backend; those without one are spread at random
+    """
+    PLACEMENTS = ('round-robin', 'load', 'hash')
+    AFFINITY_HEADER = 'X-Remoter-Affinity'
+
+    def __init__(self, backends, placement='round-robin', refresh=5):
+        if placement not in Router.PLACEMENTS:
+            raise ValueError("Unknown placement {}".format(placement))
+        # [(base url, session factory)], indexed by shard
+        self.backends = backends
+        self.sessions = None
+        self.placement = placement
+        self.refresh = refresh
+        self.rotation = itertools.cycle(range(len(backends)))
+        self.ring = HashRing(len(backends))
+        # Live games on each backend, or None for those that couldn't be asked
+        self.loads = [0] * len(backends)
+        self.tasks = []
+        app = self.app = web.Application()
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        app.add_routes([web.get('/metrics', self.scrape),
+                        web.route('*', '/{cls}', self.forward),
+                        web.route('*', '/{cls}/{instance}', self.forward),
+                        web.route('*', '/{cls}/{instance}/{tail:.*}', self.forward),
+                        ])
+
+    def run(self, host=None, port=None, path=None):
+        web.run_app(self.app, host=host, port=port, path=path)
+
+    async def start(self, app):
+        self.sessions = [make() for _, make in self.backends]
+        if self.placement == 'load':
+            self.tasks.append(asyncio.create_task(self.watch_loads()))
+
+    async def stop(self, app):
+        for t in self.tasks:
+            t.cancel()
+        for session in self.sessions:
+            await session.close()
+
+    def shard(self, request):
+        try:
+            return int(request.match_info['instance']) % len(self.backends)
+        except (KeyError, ValueError):
+            pass
+        if request.method == 'POST' and 'instance' not in request.match_info:
+            return self.place(request)
+        # The method table: any backend will do
+        return next(self.rotation)
+
+    def place(self, request):
+        """Choose a backend for a new game"""
+        if self.placement == 'hash':
+            key = request.headers.get(Router.AFFINITY_HEADER) or str(random.getrandbits(64))
+            return self.ring.node(key)
+        if self.placement == 'load':
+            live = [n for n, load in enumerate(self.loads) if load is not None]
+            if live:
+                shard = min(live, key=lambda n: self.loads[n])
+                self.loads[shard] += 1
+                return shard
+        return next(self.rotation)
+
+    async def watch_loads(self):
+        while True:
+            self.loads = await asyncio.gather(*(self.load(session, url)
+                                                for session, (url, _) in zip(self.sessions, self.backends)))
+            await asyncio.sleep(self.refresh)
+
+    async def load(self, session, url):
+        try:
+            async with session.get(url + '/metrics') as resp:
+                samples = metrics.parse(await resp.text())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            log.warning("cannot read the load of %s: %s", url, ex)
+            return None
+        return sum(v for (name, _), v in samples.items() if name == 'remoter_instances')
+
+    # GET /metrics
+    #
+    # Everything each backend reports, labelled with its shard
+    async def scrape(self, request):
+        async def fetch(session, url):
+            async with session.get(url + '/metrics') as resp:
+                return await resp.text()
+        texts = await asyncio.gather(*(fetch(session, url) for session, (url, _) in zip(self.sessions, self.backends)))
+        return web.Response(body=metrics.merge(texts, 'shard').encode(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+    async def forward(self, request):
+        shard = self.shard(request)
+        url = self.backends[shard][0] + request.rel_url.path_qs
+        session = self.sessions[shard]
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_HEADERS}
+
+        if request.headers.get('Upgrade', '').lower() == 'websocket':
+            return await self.forward_socket(request, session, url, headers)
+
+        async with session.request(request.method, url, data=await request.read(), headers=headers) as resp:
+            body = await resp.read()
+            return web.Response(status=resp.status, body=body,
+                                headers={k: v for k, v in resp.headers.items() if k.lower() not in HOP_HEADERS})
+
+    async def forward_socket(self, request, session, url, headers):
+        offered = [p.strip() for p in request.headers.get('Sec-WebSocket-Protocol', '').split(',') if p.strip()]
+        async with session.ws_connect(url, protocols=offered, headers=headers) as upstream:
+            # Agree to whatever subprotocol the backend picked
+            ws = web.WebSocketResponse(protocols=[upstream.protocol] if upstream.protocol else ())
+            await ws.prepare(request)
+
+            pumps = [asyncio.create_task(pump(ws, upstream)), asyncio.create_task(pump(upstream, ws))]
+            try:
+                await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for p in pumps:
+                    p.cancel()
+                await ws.close()
+        return ws
+
+
+async def pump(src, dst):
+    async for msg in src:
+        if msg.type == aiohttp.WSMsgType.TEXT:
+            await dst.send_str(msg.data)
+        elif msg.type == aiohttp.WSMsgType.BINARY:
+            await dst.send_bytes(msg.data)
+        else:
+            break
+    await dst.close()
+
+
+def unix_backend(path):
+    # Long-polls are parked upstream, so don't time them out here, nor limit how many are open at once
+    return ('http://shard', lambda: aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=path, limit=0),
+                                                          timeout=aiohttp.ClientTimeout(total=None)))
+
+
+def tcp_backend(url):
+    return (url.rstrip('/'), lambda: aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0),
+                                                           timeout=aiohttp.ClientTimeout(total=None)))
+
+
+def backend(address):
+    """A backend from its address: a base URL such as http://10.0.0.2:8080, or unix:<path>"""
+    if address.startswith('unix:'):
+        return unix_backend(address[len('unix:'):])
+    return tcp_backend(address)
+
+
+def serve_shard(classes, shard, shards, path, kwargs):
+    if kwargs.get('snapshot'):
+        # Each worker keeps its own games
+        kwargs = dict(kwargs, snapshot='{}.{}'.format(kwargs['snapshot'], shard))
+    srv = remoter.server.Server(shard=shard, shards=shards, **kwargs)
+    for c in classes:
+        srv.register(c)
+    srv.run(path=path)
+
+
+def run(classes, workers, host=None, port=None, path=None, placement='round-robin', **kwargs):
+    """Serve the classes from several worker processes, one shard each, behind a Router on host:port
+    (or the Unix socket path).
+
+    Workers listen on Unix sockets in a private directory. Further keyword arguments go to each Server.
+    """
+    sockets = tempfile.mkdtemp(prefix='remoter-')
+    paths = [os.path.join(sockets, 'shard-{}.sock'.format(n)) for n in range(workers)]
+    procs = [multiprocessing.Process(target=serve_shard, args=(classes, n, workers, path, kwargs), daemon=True)
+             for n, path in enumerate(paths)]
+    for p in procs:
+        p.start()
+
+    router = Router([unix_backend(path) for path in paths], placement=placement)
+
+    async def ready(app):
+        # Wait for every worker to be listening before taking requests
+        while not all(os.path.exists(path) for path in paths):
+            await asyncio.sleep(0.05)
+    router.app.on_startup.insert(0, ready)
+
+    try:
+        router.run(host=host, port=port, path=path)
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join()
+        shutil.rmtree(sockets, ignore_errors=True)
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+import os
+import pickle
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class Snapshots:
+    """Periodically save every game to a file, so that a restarted server can pick them up again.
+
+    Each game is pickled together with its players' outstanding events and future results.
+    A game that defines a `resume` coroutine has it launched after being restored: that
+    should pick up wherever the game had got to. Calls it repeats that were still awaiting
+    the player when the snapshot was taken are matched up with the restored events rather
+    than being sent twice.
+    """
+    def __init__(self, path, interval=10):
+        self.path = path
+        self.interval = interval
+        # A periodic write may still be going on in its thread when the final one starts
+        self.writing = threading.Lock()
+
+    def save(self, handlers):
+        """Write all instances of all handlers, replacing the previous snapshot in one step"""
+        return self.write({name: h.snapshot() for name, h in handlers.items()})
+
+    def write(self, state):
+        with self.writing:
+            tmp = self.path + '.tmp'
+            with open(tmp, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        return sum(len(s) for s in state.values())
+
+    def restore(self, handlers):
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return 0
+        restored = 0
+        for name, states in state.items():
+            if name in handlers:
+                restored += handlers[name].restore(states)
+            else:
+                log.warning("not restoring instances of unregistered class %s", name)
+        return restored
+
+    async def run(self, handlers):
+        while True:
+            await asyncio.sleep(self.interval)
+            # Games are pickled here, between their moves; the file is written and synced off the event loop
+            state = {name: h.snapshot() for name, h in handlers.items()}
+            await asyncio.get_running_loop().run_in_executor(None, self.write, state)
@@ -0,0 +1,335 @@
+import asyncio
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+import pytest
+
+from remoter import BasePlayer, DeadlineExceeded, hooks, metrics
+from remoter.client import Client, Host, play_many
+from remoter.server import Server
+
+
+class Guess:
+    def __init__(self):
+        self.players = []
+
+    async def new_player(self, p):
+        self.players.append(p)
+        n = len(self.players)
+        await p.hello(n)
+        await p.exit(n)
+
+    async def double(self, n):
+        return n * 2
+
+    async def fail(self):
+        raise ValueError("no")
+
+    async def lookup(self, key):
+        return {}[key]
+
+
+class Guesser(BasePlayer):
+    async def hello(self, n):
+        assert await self.game.double(n) == n * 2
+
+
+class Batcher(BasePlayer):
+    async def hello(self, n):
+        async with self.batch() as batch:
+            results = [batch.double(i) for i in range(5)]
+        assert [r.result() for r in results] == [0, 2, 4, 6, 8]
+
+        # (A remote failure is a RuntimeError; a local one, the game's own)
+        with pytest.raises((RuntimeError, ValueError)):
+            async with self.batch() as batch:
+                before, failed, after = batch.double(1), batch.fail(), batch.double(2)
+        assert before.result() == 2
+        assert failed.exception() is not None
+        assert after.cancelled()
+
+
+class Tally:
+    def __init__(self):
+        self.records = []
+
+    async def new_player(self, p):
+        # One-way calls return at once, without waiting for the player
+        for i in range(5):
+            assert await p.note(i) is None
+        await p.exit(await p.total())
+
+
+class Noter(BasePlayer):
+    def __init__(self, game=None):
+        super().__init__(game)
+        self.notes = []
+
+    async def note(self, i, _ack=False):
+        self.notes.append(i)
+
+    async def total(self):
+        # ...but still run in order, before any later call
+        assert self.notes == list(range(5))
+        return sum(self.notes)
+
+
+class Hurried:
+    deadline = 0.2
+
+    async def new_player(self, p):
+        await p.hurry()
+        try:
+            await p.dawdle()
+        except DeadlineExceeded:
+            await p.exit(2)
+
+    async def slow(self):
+        await asyncio.sleep(5)
+
+    async def crawl(self, _await=False):
+        await asyncio.sleep(5)
+
+
+class Hasty(BasePlayer):
+    async def hurry(self):
+        for call in (self.game.slow, self.game.crawl):
+            with pytest.raises(DeadlineExceeded):
+                await call(_deadline=0.05)
+
+    async def dawdle(self):
+        await asyncio.sleep(5)
+
+
+class Rejoin:
+    def __init__(self):
+        self.going = asyncio.Event()
+
+    async def new_player(self, p):
+        await p.leave()
+        await self.going.wait()
+        await p.exit(3)
+
+    async def go(self):
+        self.going.set()
+
+
+class Leaver(BasePlayer):
+    async def leave(self):
+        # Disconnect, once the call has been acknowledged
+        sys.exit(0)
+
+
+async def serve():
+    srv = Server(max_wait=1)
+    srv.register(Guess)
+    srv.register(Tally)
+    srv.register(Hurried)
+    srv.register(Rejoin)
+    runner = web.AppRunner(srv.app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, runner.addresses[0][1]
+
+
+def test_host_plays_many_players_in_one_process():
+    async def run():
+        runner, port = await serve()
+        try:
+            async with Host('127.0.0.1', port, limit=20) as host:
+                # Each player exits with its number in its game; none takes the others down
+                codes = await play_many(host, Guess, Guesser, 7, per_game=3, rounds=2, wait=1)
+                assert sorted(codes) == [1] * 6 + [2] * 4 + [3] * 4
+
+                game = await host.new_game(Guess)
+                assert await host.play(Client(Guess, Guesser, transport='ws'), game) == 1
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_batch():
+    async def run():
+        runner, port = await serve()
+        try:
+            async with Host('127.0.0.1', port) as host:
+                for transport in Client.TRANSPORTS:
+                    game = await host.new_game(Guess)
+                    assert await host.play(Client(Guess, Batcher, transport=transport, wait=1), game) == 1
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_local_batch():
+    async def run():
+        p = Batcher(Guess())
+        await p.hello(1)
+
+    asyncio.run(run())
+
+
+def test_one_way_calls():
+    async def run():
+        runner, port = await serve()
+        try:
+            async with Host('127.0.0.1', port) as host:
+                for transport in Client.TRANSPORTS:
+                    game = await host.new_game(Tally)
+                    client = Client(Tally, Noter, transport=transport, wait=1)
+                    assert await host.play(client, game) == 10
+                    # Nothing is left behind to track events the player has finished with
+                    assert client.completed == set()
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_deadlines():
+    async def run():
+        runner, port = await serve()
+        try:
+            async with Host('127.0.0.1', port) as host:
+                for transport in Client.TRANSPORTS:
+                    game = await host.new_game(Hurried)
+                    # Both sides give up on overdue calls, rather than waiting out the sleeps
+                    started = time.monotonic()
+                    assert await host.play(Client(Hurried, Hasty, transport=transport, wait=1), game) == 2
+                    assert time.monotonic() - started < 2
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_unix_socket(tmp_path):
+    async def run():
+        srv = Server(max_wait=1)
+        srv.register(Guess)
+        runner = web.AppRunner(srv.app)
+        await runner.setup()
+        path = str(tmp_path / 'server.sock')
+        await web.UnixSite(runner, path).start()
+        try:
+            async with Host(path=path) as host:
+                game = await host.new_game(Guess)
+                assert await host.play(Client(Guess, Guesser, wait=1), game) == 1
+
+            # A lone client opens its own session over the socket
+            cli = Client(Guess, Guesser, wait=1)
+            cli.announce = False
+            cli.connect(path=path)
+            assert await cli.dispatch(None, None) == 1
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_long_running_result_before_its_id():
+    async def run():
+        client = Client(Guess, Guesser)
+
+        # The result is fetched by a poll before the POST that started the call has returned its id
+        async def post(*path, args=None, headers=None, params=None):
+            await asyncio.sleep(0)
+            client.settle(7, 'done')
+            return 7
+        client.post = post
+        assert await client.call(1, 2, 'slow', {}, _await=False, deadline=1) == 'done'
+        assert client.early == {} and client.futures == {}
+
+        # Results for calls that have given up waiting are dropped
+        client.settle(8, 'late')
+        assert client.early == {}
+
+    asyncio.run(run())
+
+
+def test_socket_calls_end_with_the_socket():
+    async def run():
+        runner, port = await serve()
+        outcomes = []
+        hook = hooks.add(after=lambda c: outcomes.append((c.method, c.outcome)) if c.side == 'server' else None)
+        try:
+            url = 'http://127.0.0.1:{}/remoter.test_client.Hurried'.format(port)
+            async with aiohttp.ClientSession() as session:
+                async with session.post(url) as r:
+                    game = await r.json()
+                async with session.post('{}/{}/player'.format(url, game)) as r:
+                    pid = await r.json()
+                async with session.ws_connect('{}/{}/player/{}/ws'.format(url, game, pid)) as ws:
+                    await ws.send_json({'op': 'call', 'id': 1, 'method': 'slow', 'args': {}})
+                    await asyncio.sleep(0.05)
+                await asyncio.sleep(0.05)
+            assert ('slow', 'cancelled') in outcomes
+        finally:
+            hooks.remove(hook)
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_gone_games_and_players_are_not_found():
+    async def run():
+        runner, port = await serve()
+        try:
+            url = 'http://127.0.0.1:{}/remoter.test_client.Guess'.format(port)
+            async with aiohttp.ClientSession() as session:
+                async with session.post(url) as r:
+                    game = await r.json()
+                for method, path in (('POST', '/1/double'), ('POST', '/1/batch'), ('POST', '/1/player'),
+                                     ('GET', '/{}/player/1/e'.format(game)), ('GET', '/1/player/1/ws'),
+                                     ('POST', '/{}/player/1/sync'.format(game))):
+                    async with session.request(method, url + path) as r:
+                        assert r.status == 404, path
+                # Nor is a long-running call on behalf of a player that's gone
+                async with session.post('{}/{}/double'.format(url, game), json={'': [1]},
+                                        headers={Server.REMOTER_HEADER: '1'}) as r:
+                    assert r.status == 404
+                # Collecting a result that has already gone is harmless
+                async with session.post('{}/{}/player'.format(url, game)) as r:
+                    pid = await r.json()
+                async with session.post('{}/{}/player/{}/sync'.format(url, game, pid), json={'futures': [5]}) as r:
+                    assert r.status == 200
+                # A game's own KeyError is still a server error
+                async with session.post('{}/{}/lookup'.format(url, game), json={'': ['x']}) as r:
+                    assert r.status == 500
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_reconnecting_player_waits_quietly():
+    async def run():
+        runner, port = await serve()
+        try:
+            url = 'http://127.0.0.1:{}/remoter.test_client.Rejoin'.format(port)
+            async with Host('127.0.0.1', port) as host, aiohttp.ClientSession() as session:
+                for transport in Client.TRANSPORTS:
+                    game = await host.new_game(Rejoin)
+                    client = Client(Rejoin, Leaver, transport=transport, wait=1)
+                    assert await host.play(client, game) == 0
+
+                    # Back as the same player, from cursor 0, with every event already acknowledged
+                    again = asyncio.create_task(host.play(Client(Rejoin, Leaver, transport=transport, wait=1),
+                                                          game, client.pid))
+                    requests = sum(metrics.REQUESTS.values.values())
+                    await asyncio.sleep(0.3)
+                    assert sum(metrics.REQUESTS.values.values()) - requests < 5, transport
+
+                    # ...but it hears about the next call at once
+                    async with session.post('{}/{}/go'.format(url, game)) as r:
+                        assert r.status == 200
+                    assert await asyncio.wait_for(again, 0.5) == 3
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
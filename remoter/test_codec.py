@@ -0,0 +1,22 @@
+import pytest
+
+from remoter import codec
+
+
+@pytest.mark.parametrize('name', sorted(codec.CODECS))
+def test_round_trip(name):
+    c = codec.get(name)
+    msg = {'events': {1: ['guess', [['  0123456789', 'a ~~~~~~~~~~'], []], {}]}, 'futures': {}}
+    # Mapping keys may come back as strings, as they do with JSON
+    got = c.loads(c.dumps(msg))
+    assert {int(k): v for k, v in got['events'].items()} == msg['events']
+    assert c.loads(c.dumps(None)) is None
+
+
+def test_negotiation():
+    assert codec.for_content_type('application/json; charset=utf-8') is codec.JSON
+    assert codec.for_content_type('text/html, */*') is None
+    assert codec.for_content_type(None, codec.JSON) is codec.JSON
+    assert codec.for_protocol(codec.protocol(codec.JSON)) is codec.JSON
+    with pytest.raises(ValueError):
+        codec.get('no-such-codec')
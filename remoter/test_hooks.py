@@ -0,0 +1,52 @@
+import asyncio
+
+from remoter import hooks
+from remoter.server import Handler
+
+
+class Echo:
+    async def new_player(self, p):
+        await p.print("hello")
+
+    async def echo(self, x):
+        return x
+
+    async def fail(self):
+        raise ValueError("no")
+
+
+def test_hooks_see_game_and_player_calls():
+    async def run():
+        seen = []
+
+        def broken(call):
+            raise RuntimeError("hooks must not break calls")
+        h1 = hooks.add(before=broken)
+        h2 = hooks.add(after=lambda c: seen.append((c.side, c.target, c.method, c.size, c.outcome)))
+        try:
+            h = Handler(Echo)
+            n = h.new()
+            assert await h.invoke(n, 'echo', {'': (1,)}) == 1
+            try:
+                await h.invoke(n, 'fail', {})
+            except ValueError:
+                pass
+
+            pid = h.new_player(n)
+            await asyncio.sleep(0)
+            h.ack_event(n, pid, 1, None)
+            await asyncio.sleep(0)
+        finally:
+            hooks.remove(h1)
+            hooks.remove(h2)
+
+        assert seen == [('server', 'game', 'echo', 1, 'ok'),
+                        ('server', 'game', 'fail', 0, 'error'),
+                        ('server', 'player', 'print', 1, 'ok')]
+
+    asyncio.run(run())
+
+
+def test_no_hooks_no_calls():
+    assert hooks.start('server', 'game', 'echo', (), {}) is None
+    hooks.finish(None, 'ok')
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from remoter import metrics
+from remoter.client import Client, play_many
+from remoter.loopback import Host
+from remoter.server import Server
+from remoter.test_client import Batcher, Guess, Guesser, Hasty, Hurried, Noter, Tally
+
+
+def server():
+    srv = Server(max_wait=1)
+    for cls in (Guess, Tally, Hurried):
+        srv.register(cls)
+    return srv
+
+
+def test_loopback():
+    async def run():
+        requests = sum(metrics.REQUESTS.values.values())
+        async with Host(server()) as host:
+            for transport in ('http', 'sync'):
+                codes = await play_many(host, Guess, Guesser, 5, per_game=3, transport=transport, wait=1)
+                assert sorted(codes) == [1, 1, 2, 2, 3]
+
+                for cls, plr, code in ((Guess, Batcher, 1), (Tally, Noter, 10), (Hurried, Hasty, 2)):
+                    game = await host.new_game(cls)
+                    assert await host.play(Client(cls, plr, transport=transport, wait=1), game) == code
+
+            with pytest.raises(RuntimeError):
+                await host.play(Client(Guess, Guesser, transport='ws'), await host.new_game(Guess))
+        # Requests go through the server's middleware, as they would over HTTP
+        assert sum(metrics.REQUESTS.values.values()) > requests
+
+    asyncio.run(run())
@@ -0,0 +1,39 @@
+import pytest
+
+from remoter.methods import check, from_json, lookup, method_table, to_json
+from example.demo import Demo, Player
+
+
+def test_method_table():
+    table = method_table(Demo)
+    assert set(table) == {'new_player', 'ping', 'test'}
+    assert table['test'].awaits
+    assert not table['ping'].awaits
+    assert table['ping'].params == ('x',)
+    assert method_table(Demo) is table
+
+
+def test_lookup_defaults():
+    assert lookup(Player, 'no_such_method') is None
+    assert 'no_such_method' not in method_table(Player)
+    assert lookup(Player, 'long_callback').awaits is False
+    assert lookup(Player, 'print').awaits is True
+
+
+def test_check():
+    m = lookup(Demo, 'ping')
+    check(m, (1,), {})
+    check(m, (), {'x': 1})
+    with pytest.raises(TypeError):
+        check(m, (), {})
+    with pytest.raises(TypeError):
+        check(m, (1, 2), {})
+    with pytest.raises(TypeError):
+        check(m, (1,), {'x': 1})
+    with pytest.raises(TypeError):
+        check(m, (1,), {'y': 1})
+
+
+def test_json_round_trip():
+    table = method_table(Demo)
+    assert from_json(to_json(table)) == {k: m for k, m in table.items() if m is not None}
@@ -0,0 +1,37 @@
+from remoter.metrics import Counter, Histogram, Registry, merge, parse
+
+
+def test_exposition():
+    r = Registry()
+    c = r.add(Counter('calls_total', 'Calls', ('method',)))
+    h = r.add(Histogram('call_seconds', 'Call time', ('method',), buckets=(0.1, 1)))
+    c.inc('guess')
+    c.inc('guess')
+    h.observe(0.05, 'guess')
+    h.observe(0.5, 'guess')
+    h.observe(5, 'guess')
+
+    lines = r.exposition().splitlines()
+    assert 'calls_total{method="guess"} 2' in lines
+    assert 'call_seconds_bucket{method="guess",le="0.1"} 1' in lines
+    assert 'call_seconds_bucket{method="guess",le="1"} 2' in lines
+    assert 'call_seconds_bucket{method="guess",le="+Inf"} 3' in lines
+    assert 'call_seconds_count{method="guess"} 3' in lines
+
+
+def test_merge():
+    text = '# HELP up Up\n# TYPE up gauge\nup 1\nthings{kind="a"} 2\n'
+    assert merge([text, text], 'shard').splitlines() == [
+        '# HELP up Up', '# TYPE up gauge',
+        'up{shard="0"} 1', 'things{shard="0",kind="a"} 2',
+        'up{shard="1"} 1', 'things{shard="1",kind="a"} 2']
+
+
+def test_parse():
+    r = Registry()
+    r.add(Counter('calls_total', 'Calls', ('method',))).inc('say "hi"')
+    r.add(Histogram('call_seconds', 'Call time', buckets=(1,))).observe(0.5)
+    samples = parse(r.exposition())
+    assert samples['calls_total', (('method', r'say \"hi\"'),)] == 1
+    assert samples['call_seconds_bucket', (('le', '+Inf'),)] == 1
+    assert samples['call_seconds_sum', ()] == 0.5
@@ -0,0 +1,299 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from remoter import DeadlineExceeded, metrics, offload, within
+from remoter.lifecycle import FlowControl, Lifecycle, TooManyCalls, TooManyGames
+from remoter.methods import method_table
+from remoter.pools import Pools
+from remoter.server import EHRecord, Handler
+from remoter.snapshot import Snapshots
+
+
+def test_wait_returns_when_event_posted():
+    async def run():
+        r = EHRecord()
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, r.post_event, 'print', ('hi',), {}, asyncio.Future())
+        started = time.monotonic()
+        await r.wait(5)
+        assert time.monotonic() - started < 1
+        assert r.take_events() == {1: ('print', ('hi',), {})}
+
+    asyncio.run(run())
+
+
+def test_wait_times_out_once_events_delivered():
+    async def run():
+        r = EHRecord()
+        r.post_event('print', ('hi',), {}, asyncio.Future())
+        await r.wait(5)
+        r.take_events()
+
+        started = time.monotonic()
+        await r.wait(0.1)
+        assert time.monotonic() - started >= 0.1
+
+    asyncio.run(run())
+
+
+def test_events_since_cursor():
+    async def run():
+        r = EHRecord()
+        for i in range(3):
+            r.post_event('print', (i,), {}, asyncio.Future())
+        assert sorted(r.take_events(since=1)) == [2, 3]
+
+        # A player that has seen everything is parked; one that hasn't is not
+        started = time.monotonic()
+        await r.wait(5, since=1)
+        assert time.monotonic() - started < 1
+        await r.wait(0.1, since=3)
+        assert time.monotonic() - started >= 0.1
+
+    asyncio.run(run())
+
+
+def test_one_way_events_dropped_once_seen():
+    async def run():
+        r = EHRecord(one_way=['print'])
+        r.post_event('print', ('hi',), {}, None)
+        r.post_event('guess', (), {}, asyncio.Future())
+        assert sorted(r.take_events()) == [1, 2]
+        # Nobody acknowledges the print: the cursor passing it is enough
+        assert sorted(r.take_events(since=2)) == []
+        assert sorted(r.events) == [2]
+
+    asyncio.run(run())
+
+
+class Waiting:
+    async def new_player(self, p):
+        await p.print("hello")
+
+
+def test_lifecycle_evicts_idle_games():
+    async def run():
+        h = Handler(Waiting)
+        idle = h.new()
+        h.new_player(idle)
+        await asyncio.sleep(0)
+        task, = h.instances[idle][1].tasks
+        busy = h.new()
+
+        lc = Lifecycle(idle_ttl=10, max_games=2)
+        with pytest.raises(TooManyGames):
+            lc.admit([h])
+
+        now = time.monotonic()
+        assert lc.sweep([h], now + 5) == {}
+        h.instances[busy][1].last_active = now + 10
+        assert lc.sweep([h], now + 15) == {'games': 1, 'players': 1, 'events': 1}
+        assert list(h.instances) == [busy]
+        lc.admit([h])
+
+        # The game coroutine waiting on the evicted player is cancelled
+        await asyncio.sleep(0)
+        assert task.cancelled()
+
+    asyncio.run(run())
+
+
+def test_periodic_snapshots(tmp_path):
+    async def run():
+        h = Handler(Waiting)
+        g = h.new()
+        h.new_player(g)
+        await asyncio.sleep(0)
+
+        snapshots = Snapshots(str(tmp_path / 'games'), interval=0.01)
+        task = asyncio.create_task(snapshots.run({h.name: h}))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        # The final save may overlap a periodic write still finishing in its thread
+        assert snapshots.save({h.name: h}) == 1
+        h.evict(g)
+
+        again = Handler(Waiting)
+        assert snapshots.restore({again.name: again}) == 1
+        # A game whose id is already taken isn't restored over it
+        assert snapshots.restore({again.name: again}) == 0
+        (pid, record), = again.instances[g][1].events.items()
+        assert [e.call for e in record.events.values()] == ['print']
+
+    asyncio.run(run())
+
+
+def test_instance_ids_are_not_reused():
+    h = Handler(Waiting, shard=1, shards=3)
+    seen = set()
+    for _ in range(100):
+        n = h.new()
+        assert n not in seen and n % 3 == 1
+        seen.add(n)
+        # Once evicted, the game is freed: a new one mustn't take over its id
+        h.evict(n)
+
+
+class Flood:
+    async def new_player(self, p):
+        for i in range(5):
+            await p.print(i)
+
+    async def slow(self, _await=False):
+        await asyncio.sleep(10)
+
+
+def test_flow_control_waits_for_room():
+    async def run():
+        h = Handler(Flood, flow=FlowControl(max_events=2))
+        g = h.new()
+        # One-way calls don't wait on the player, so they would otherwise pile up
+        pid = h.new_player(g, one_way=['print'])
+        eh = h.instances[g][1]
+        task, = eh.tasks
+        waited = metrics.FLOW_CONTROL.values.get(('events', 'waited'), 0)
+        await asyncio.sleep(0.01)
+        assert sorted(eh.player_events(pid)) == [1, 2]
+        assert metrics.FLOW_CONTROL.values[('events', 'waited')] == waited + 1
+
+        # The player catching up makes room for more
+        eh.player_events(pid, since=2)
+        await asyncio.sleep(0.01)
+        assert sorted(eh.player_events(pid, since=2)) == [3, 4]
+
+        # Evicting the player frees anything waiting on it
+        h.evict(g)
+        await asyncio.sleep(0)
+        assert task.done()
+
+    asyncio.run(run())
+
+
+def test_flow_control_limits():
+    async def run():
+        h = Handler(Flood, flow=FlowControl(max_events=1, max_futures=2, overflow='error'))
+        g = h.new()
+        pid = h.new_player(g)
+        eh = h.instances[g][1]
+        record = eh.events[pid]
+        record.post_event('print', ('hi',), {}, asyncio.Future())
+        with pytest.raises(TooManyCalls):
+            await eh.admit(pid, 'events')
+
+        for _ in range(2):
+            await h.invoke_async(g, pid, 'slow', {})
+        refused = metrics.FLOW_CONTROL.values.get(('futures', 'refused'), 0)
+        with pytest.raises(TooManyCalls):
+            await h.invoke_async(g, pid, 'slow', {})
+        assert metrics.FLOW_CONTROL.values[('futures', 'refused')] == refused + 1
+        await asyncio.sleep(0)
+        h.evict(g)
+
+    asyncio.run(run())
+
+
+class Impatient:
+    deadline = 0.05
+
+    def __init__(self):
+        self.missed = False
+
+    async def new_player(self, p):
+        try:
+            await p.think()
+        except DeadlineExceeded:
+            self.missed = True
+
+
+def test_player_deadlines():
+    async def run():
+        for policy, events, evicted in (('raise', [], False), ('forfeit', None, True), ('retry', [], False)):
+            Impatient.on_deadline = policy
+            h = Handler(Impatient)
+            g = h.new()
+            pid = h.new_player(g)
+            i, eh = h.instances[g]
+            await asyncio.sleep(0.01)
+            # The player is told how long it has
+            (call, args, kwargs, deadline), = eh.player_events(pid).values()
+            assert call == 'think' and 0 < deadline <= 0.05
+            await asyncio.sleep(0.05 if policy != 'retry' else 0.1)
+            # When the game gives up, the call is withdrawn; with 'forfeit', the player goes too
+            assert i.missed
+            assert (pid not in eh.events) == evicted
+            if not evicted:
+                assert list(eh.player_events(pid)) == events
+        del Impatient.on_deadline
+
+    asyncio.run(run())
+
+
+@pytest.mark.skipif(not hasattr(asyncio.Task, 'uncancel'), reason='needs Python 3.11 to count cancels')
+def test_deadline_keeps_outside_cancels():
+    async def stuck():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            # Someone else cancels the task too, just as its deadline passes
+            asyncio.current_task().cancel()
+            raise
+
+    async def run():
+        task = asyncio.create_task(within(stuck(), 0.01, 'stuck'))
+        await asyncio.wait([task])
+        assert task.cancelled()
+
+        task = asyncio.create_task(within(asyncio.sleep(1), 0.01, 'sleep'))
+        await asyncio.wait([task])
+        assert isinstance(task.exception(), DeadlineExceeded)
+
+    asyncio.run(run())
+
+
+class Heavy:
+    def __init__(self):
+        self.moves = 0
+
+    @offload
+    def crunch(self, seconds):
+        # Stands in for CPU-bound work that would hold up the event loop
+        time.sleep(seconds)
+        return threading.current_thread().name
+
+    @offload(pool='process')
+    def plan(self):
+        self.moves = -1
+        return os.getpid()
+
+    async def move(self):
+        self.moves += 1
+        return self.moves
+
+
+def test_offloaded_methods():
+    async def run():
+        h = Handler(Heavy, pools=Pools(processes=1))
+        g = h.new()
+        try:
+            assert {'crunch', 'plan', 'move'} <= set(method_table(Heavy))
+            # Other calls go on while a heavy one runs
+            crunch = asyncio.create_task(h.invoke(g, 'crunch', {'': (0.2,)}))
+            await asyncio.sleep(0.01)
+            assert [await h.invoke(g, 'move', {}) for _ in range(3)] == [1, 2, 3]
+            assert not crunch.done()
+            assert (await crunch).startswith('remoter')
+
+            # A process works on a copy of the game
+            assert await h.invoke(g, 'plan', {}) != os.getpid()
+            assert h.instances[g][0].moves == 3
+
+            with pytest.raises(DeadlineExceeded):
+                await h.invoke(g, 'crunch', {'': (0.2,)}, deadline=0.05)
+        finally:
+            h.pools.shutdown()
+
+    asyncio.run(run())
@@ -0,0 +1,132 @@
+import asyncio
+from collections import Counter
+import multiprocessing
+import socket
+import time
+
+import aiohttp
+from aiohttp import web
+
+from remoter import metrics
+from remoter.client import Client, Host
+from remoter.server import Server
+from remoter.shard import HashRing, Router, run, tcp_backend
+from remoter.test_client import Guess, Guesser
+
+
+async def site(app):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    return runner, runner.addresses[0][1]
+
+
+async def cluster(n, **kwargs):
+    """n backend servers, each on its own port, behind a Router; returns the servers, runners and router port"""
+    servers, runners = [], []
+    for shard in range(n):
+        srv = Server(max_wait=1, shard=shard, shards=n)
+        srv.register(Guess)
+        runner, port = await site(srv.app)
+        servers.append(srv)
+        runners.append(runner)
+    ports = [r.addresses[0][1] for r in runners]
+    router = Router([tcp_backend('http://127.0.0.1:{}'.format(p)) for p in ports], **kwargs)
+    runner, port = await site(router.app)
+    return servers, runners + [runner], port
+
+
+def games(srv):
+    return len(srv.handlers['remoter.test_client.Guess'].instances)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def scrape(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get('http://127.0.0.1:{}/metrics'.format(port)) as r:
+                    return metrics.parse(await r.text())
+            except aiohttp.ClientConnectionError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.05)
+
+
+def test_run_shards_games_over_workers():
+    port = free_port()
+    proc = multiprocessing.Process(target=run, args=((Guess,), 2), kwargs=dict(host='127.0.0.1', port=port,
+                                                                              max_wait=1))
+    proc.start()
+
+    async def play():
+        await scrape(port)
+        async with Host('127.0.0.1', port) as host:
+            ids = [await host.new_game(Guess) for _ in range(4)]
+            # Each id names the worker that made it; every request for the game must reach that worker
+            for game in ids:
+                assert await host.play(Client(Guess, Guesser, wait=1), game) == 1
+        return ids, await scrape(port)
+
+    try:
+        ids, samples = asyncio.run(play())
+    finally:
+        proc.terminate()
+        proc.join()
+    assert sorted(n % 2 for n in ids) == [0, 0, 1, 1]
+    live = {dict(labels)['shard']: v for (name, labels), v in samples.items() if name == 'remoter_instances'}
+    assert live == {'0': 2, '1': 2}
+
+
+def test_router_places_by_load():
+    async def run():
+        # One reading of the loads, at startup: one taken while a game is being placed could miss it
+        servers, runners, port = await cluster(3, placement='load', refresh=60)
+        try:
+            await asyncio.sleep(0.1)
+            async with Host('127.0.0.1', port) as host:
+                ids = [await host.new_game(Guess) for _ in range(6)]
+                assert [games(s) for s in servers] == [2, 2, 2]
+
+                # Games are played on whichever backend owns them, over every transport
+                for game, transport in zip(ids, Client.TRANSPORTS):
+                    assert await host.play(Client(Guess, Guesser, transport=transport, wait=1), game) == 1
+        finally:
+            for r in reversed(runners):
+                await r.cleanup()
+
+    asyncio.run(run())
+
+
+def test_router_places_by_affinity():
+    async def run():
+        servers, runners, port = await cluster(3, placement='hash')
+        try:
+            async with aiohttp.ClientSession() as session:
+                url = 'http://127.0.0.1:{}/remoter.test_client.Guess'.format(port)
+                for _ in range(4):
+                    async with session.post(url, headers={Router.AFFINITY_HEADER: 'league-1'}) as r:
+                        assert r.status == 200
+            # All the games with the same key share a backend
+            assert sorted(games(s) for s in servers) == [0, 0, 4]
+        finally:
+            for r in reversed(runners):
+                await r.cleanup()
+
+    asyncio.run(run())
+
+
+def test_hash_ring_is_balanced_and_stable():
+    ring = HashRing(4)
+    keys = ['game-{}'.format(n) for n in range(4000)]
+    counts = Counter(ring.node(k) for k in keys)
+    assert min(counts.values()) > 600
+    # Adding a node only moves keys onto it
+    bigger = HashRing(5)
+    assert all(bigger.node(k) in (ring.node(k), 4) for k in keys)
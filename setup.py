@@ -24,6 +24,9 @@ setup(
             'batsrv = battleships.cmd:server',
             'batcli = battleships.cmd:client',
             'batbot = battleships.cmd:bot',
+            'batbench = battleships.bench:main',
+            'battour = battleships.tournament:main',
+            'remoter-router = remoter.cmd:router',
         ],
     },
 
@@ -31,6 +34,12 @@ setup(
                       "aiohttp",
                       "requests",
                      ],
+    extras_require={
+        # Optional faster / more compact wire formats
+        'codecs': ["orjson", "msgpack", "cbor2"],
+        # Vectorised targeting for battleships.bot.DensityBot
+        'numpy': ["numpy"],
+    },
     tests_require=[
                     "pytest",
                     "flake8",